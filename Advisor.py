@@ -0,0 +1,62 @@
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Tuple
+
+from Card import Card
+from Hand import Hand
+from registry import BY_NAME, COMBINATIONS
+from Solver import hand_probabilities
+
+
+class Advice(NamedTuple):
+    bets: List[Tuple[str, float]]  # legal higher bets, most likely first
+    check_wins: Optional[float]  # None on the first turn of a deal
+
+
+class Advisor:
+    # Answers bet questions for one hand and number of cards in play. Built
+    # once per deal from the Solver's probability vector (in bet order), then
+    # every query is a list lookup:
+    # - order: bet ids sorted by probability, most likely first
+    # - suffix_best[i]: the most likely bet id >= i
+
+    __slots__ = ("probabilities", "order", "suffix_best")
+
+    def __init__(self, mask: int, cards_in_play_num: int):
+        self.probabilities: List[float] = hand_probabilities(mask, cards_in_play_num).tolist()
+        self.order = sorted(range(len(COMBINATIONS)), key = lambda i: -self.probabilities[i])
+
+        self.suffix_best = [0] * len(COMBINATIONS)
+        best = len(COMBINATIONS) - 1
+        for i in reversed(range(len(COMBINATIONS))):
+            if self.probabilities[i] >= self.probabilities[best]:
+                best = i
+            self.suffix_best[i] = best
+
+    def ranked_bets(self, last_bet: Optional[int] = None) -> List[int]:
+        # Every bet id above last_bet, most likely first
+        if last_bet is None:
+            return self.order
+        return [i for i in self.order if i > last_bet]
+
+    def best_bet(self, last_bet: Optional[int] = None) -> Optional[int]:
+        low = 0 if last_bet is None else last_bet + 1
+        return self.suffix_best[low] if low < len(COMBINATIONS) else None
+
+    def check_wins(self, last_bet: int) -> float:
+        # Checking wins exactly when the last bet is not on the table
+        return 1 - self.probabilities[last_bet]
+
+
+@lru_cache(maxsize = 4096)
+def get_advisor(mask: int, cards_in_play_num: int) -> Advisor:
+    return Advisor(mask, cards_in_play_num)
+
+
+def advise(hand: List[Card], cards_in_play_num: int, last_bet: Optional[str] = None) -> Advice:
+    # Game.last_bet is a bet name, or None before the first bet of a deal
+    advisor = get_advisor(Hand.from_cards(hand).mask, cards_in_play_num)
+    last = None if last_bet is None else BY_NAME[last_bet].id
+    return Advice(
+        bets = [(COMBINATIONS[i].name, advisor.probabilities[i]) for i in advisor.ranked_bets(last)],
+        check_wins = None if last is None else advisor.check_wins(last),
+    )
@@ -1,21 +1,46 @@
 import itertools
 import random
 from typing import List, Dict
-from functools import partial
+from functools import partial, cached_property
 from math import comb
+from collections.abc import Mapping
 
 from Card import Card
+from Hand import Hand, CARDS, SMALL_STRAIGHT_MASKS, BIG_STRAIGHT_MASKS
+from registry import BY_NAME, NAMES
 
 from helpers import (
     RANKS,
     SUITS,
-    SMALL_STRAIGHT_RANKS,
-    BIG_STRAIGHT_RANKS,
     RANK_PAIRS,
     RANK_PAIRS_DESCENDING,
+    binomial,
 )
 
 
+class Combinations(Mapping):
+    # Evaluates a combination check the first time it is read and caches it.
+
+    def __init__(self, deck: "Deck"):
+        self.deck = deck
+        self.cache: Dict[str, bool] = {}
+
+    def __getitem__(self, name: str) -> bool:
+        if name not in self.cache:
+            combination = BY_NAME[name]
+            self.cache[name] = getattr(self.deck, combination.check)(**combination.kwargs)
+        return self.cache[name]
+
+    def __contains__(self, name):
+        return name in BY_NAME
+
+    def __iter__(self):
+        return iter(NAMES)
+
+    def __len__(self):
+        return len(NAMES)
+
+
 class Deck:
     def __init__(self, cards_list: List[Card] = None):
         
@@ -24,24 +49,19 @@ class Deck:
         else:
             self.cards = cards_list
 
-        self.combinations = {}
-        self.combinations.update({f'high_card_{rank}': self.is_high_card(rank=rank) for rank in RANKS})
-        self.combinations.update({f'pair_{rank}': self.is_pair(rank=rank) for rank in RANKS})
-        self.combinations.update({f'two_pair_{a}_{b}': self.is_two_pair(rank_a=a, rank_b=b) for a, b in RANK_PAIRS_DESCENDING})
-        self.combinations.update({f'small_straight': self.is_small_straight()})
-        self.combinations.update({f'big_straight': self.is_big_straight()})
-        self.combinations.update({f'three_{rank}': self.is_three(rank=rank) for rank in RANKS})
-        self.combinations.update({f'full_{a}_{b}': self.is_full(rank_three=a, rank_pair=b) for a, b in RANK_PAIRS})
-        self.combinations.update({f'quad_{rank}': self.is_quad(rank=rank) for rank in RANKS})
-        self.combinations.update({f'flush_{suit}': self.is_flush(suit=suit) for suit in SUITS})
-        self.combinations.update({f'small_poker_{suit}': self.is_small_poker(suit=suit) for suit in SUITS})
-        self.combinations.update({f'big_poker_{suit}': self.is_big_poker(suit=suit) for suit in SUITS})
+        self.hand = Hand.from_cards(self.cards)
+
+        self.combinations = Combinations(self)
 
 
     @staticmethod
     def get_all_cards():
-        return [Card(rank, suit) for (rank, suit) in itertools.product(RANKS, SUITS)]
+        return list(CARDS)
     
+    @staticmethod
+    def from_hand(hand: Hand):
+        return Deck(cards_list = hand.cards())
+
     @staticmethod
     def from_hands(hands: List[List[Card]]):
 
@@ -50,20 +70,18 @@ class Deck:
         
         return Deck(cards_list = flatten_comprehension(hands))
     
-    def get_hands(self, cards_per_hands: List[int]) -> List[List[Card]]:
-        
-        deck = self.cards
-        random.shuffle(deck)
+    def get_hands(self, cards_per_hands: List[int], rng = random) -> List[List[Card]]:
+        # rng can be the random module, a random.Random or a dealer.Stream
 
-        assert sum(cards_per_hands) <= len(deck), "Not enough cards in deck!"
+        assert sum(cards_per_hands) <= len(self.cards), "Not enough cards in deck!"
+
+        cards = rng.sample(self.cards, sum(cards_per_hands))
 
         hands = []
+        start = 0
         for cards_per_hand in cards_per_hands:
-            hands.append(deck[:cards_per_hand]) 
-            deck = deck[cards_per_hand:]
-
-        hands_chain = list(itertools.chain(*hands))
-        assert len(hands_chain) == len(set(hands_chain)), "Duplicate cards in hand!"
+            hands.append(cards[start:start + cards_per_hand])
+            start += cards_per_hand
 
         return hands
     
@@ -73,7 +91,7 @@ class Deck:
     # WAYS OF PICKING COMBINATIONS
 
     def total_ways(self, n):
-        return comb(len(self.cards), n)
+        return binomial(len(self.cards), n)
     
     def ways_ranks_nums(self, n, rank_num_dict: Dict[str, int]):
         
@@ -88,50 +106,52 @@ class Deck:
         
         for rank, num in rank_num_dict.items():
             rank_count = self.count_rank(rank)
-            ways *= comb(rank_count, num)
+            ways *= binomial(rank_count, num)
             
         rank_counts_sum = sum([self.count_rank(rank) for rank in rank_num_dict.keys()])
         
-        return ways * comb(len(self.cards) - rank_counts_sum, n - sum(nums))
+        return ways * binomial(len(self.cards) - rank_counts_sum, n - sum(nums))
     
     def ways_suit(self, n, suit, suit_num):
         if n - suit_num < 0:
             return 0
         suit_count = self.count_suit(suit)
-        return comb(suit_count, suit_num) * comb(len(self.cards) - suit_count, n - suit_num)
+        return binomial(suit_count, suit_num) * binomial(len(self.cards) - suit_count, n - suit_num)
     
     def ways_small_poker(self, n, suit, num):
         if n - num < 0:
             return 0
         poker_count = self.small_poker_count(suit)
-        return comb(poker_count, num) * comb(len(self.cards) - poker_count, n - num)
+        return binomial(poker_count, num) * binomial(len(self.cards) - poker_count, n - num)
     
     def ways_big_poker(self, n, suit, num):
         if n - num < 0:
             return 0
         poker_count = self.big_poker_count(suit)
-        return comb(poker_count, num) * comb(len(self.cards) - poker_count, n - num)
+        return binomial(poker_count, num) * binomial(len(self.cards) - poker_count, n - num)
     
 
     # COMBINATION HELPERS
-            
-    def __poker_count(self, ranks, suit):
-        return sum([1 for card in self.cards if card.is_suit(suit) and card.rank in ranks])
+
+    @cached_property
+    def rank_counts(self) -> Dict[str, int]:
+        return {rank: self.hand.count_rank(rank) for rank in RANKS}
+
+    @cached_property
+    def suit_counts(self) -> Dict[str, int]:
+        return {suit: self.hand.count_suit(suit) for suit in SUITS}
             
     def small_poker_count(self, suit):    
-        return self.__poker_count(SMALL_STRAIGHT_RANKS, suit)
+        return self.hand.small_poker_count(suit)
             
     def big_poker_count(self, suit):   
-        return self.__poker_count(BIG_STRAIGHT_RANKS, suit)
+        return self.hand.big_poker_count(suit)
     
     def count_rank(self, rank):
-        return sum(1 for card in self.cards if card.is_rank(rank))
+        return self.rank_counts[rank]
 
     def count_suit(self, suit):
-        return sum(1 for card in self.cards if card.is_suit(suit))
-    
-    def __get_card_ranks(self):
-        return {card.rank for card in self.cards}
+        return self.suit_counts[suit]
     
     # COMBINATION CHECKS
 
@@ -145,16 +165,16 @@ class Deck:
         return self.count_rank(rank_a) >= 2 and self.count_rank(rank_b) >= 2
 
     def is_small_straight(self):
-        return SMALL_STRAIGHT_RANKS.issubset(self.__get_card_ranks())
+        return self.hand.has_all_ranks(SMALL_STRAIGHT_MASKS)
 
     def is_big_straight(self):
-        return BIG_STRAIGHT_RANKS.issubset(self.__get_card_ranks())
+        return self.hand.has_all_ranks(BIG_STRAIGHT_MASKS)
 
     def is_three(self, rank):
         return self.count_rank(rank) >= 3
 
-    def is_full(self, rank_three, rank_pair):
-        return self.count_rank(rank_three) >= 3 and self.count_rank(rank_pair) >= 2
+    def is_full(self, rank_a, rank_b):
+        return self.count_rank(rank_a) >= 3 and self.count_rank(rank_b) >= 2
 
     def is_quad(self, rank):
         return self.count_rank(rank) >= 4
@@ -163,18 +183,10 @@ class Deck:
         return self.count_suit(suit) >= 5
 
     def is_small_poker(self, suit):
-        return len([
-            card for card in self.cards if 
-                card.rank in SMALL_STRAIGHT_RANKS and
-                card.is_suit(suit) 
-        ]) == 5
+        return self.small_poker_count(suit) == 5
 
     def is_big_poker(self, suit):
-        return len([
-            card for card in self.cards if 
-                card.rank in BIG_STRAIGHT_RANKS and
-                card.is_suit(suit)
-        ]) == 5
+        return self.big_poker_count(suit) == 5
     
     # STR & REPR
 
@@ -0,0 +1,169 @@
+import random
+from typing import List, NamedTuple, Optional
+
+from dealer import Stream
+from helpers import TOTAL_CARDS_NUM
+from Hand import FEATURE_MASKS
+from registry import COMBINATIONS
+
+MAX_CARDS = 3
+
+CARD_BITS = [1 << i for i in range(TOTAL_CARDS_NUM)]
+
+
+class Event(NamedTuple):
+    kind: str
+    to: Optional[str] = None  # a single player, or None for the whole table
+    sid: Optional[str] = None  # the player the event is about
+    value: object = None  # bet id for "bet", hand mask for "deal"
+
+
+class Engine:
+    # The rules of one table as a plain state machine: no transport, no
+    # card objects. Hands are bitmasks (see Hand.py), bets are combination
+    # ids and every action returns the events it produced.
+
+    __slots__ = ("sids", "players", "hand_counts", "hands", "turn", "last_bet", "deal_in_progress", "finished", "rng")
+
+    def __init__(self, sids: List[str], rng = random):
+        self.sids = list(sids)
+        self.players = list(sids)  # still at the table, in turn order
+        self.hand_counts = [1] * len(sids)
+        self.hands = [0] * len(sids)
+        self.turn = 0
+        self.last_bet: Optional[int] = None
+        self.deal_in_progress = False
+        self.finished = False
+        self.rng = rng
+
+    def start(self) -> List[Event]:
+        return [Event("start", value = self.sids)]
+
+    def cards_in_play(self) -> int:
+        return sum(self.hand_counts)
+
+    def table_mask(self) -> int:
+        mask = 0
+        for hand in self.hands:
+            mask |= hand
+        return mask
+
+    def bet_holds(self, bet: int) -> bool:
+        table = self.table_mask()
+        return all((table & FEATURE_MASKS[feature]).bit_count() >= count for feature, count in COMBINATIONS[bet].conditions)
+
+    def deal(self) -> List[Event]:
+        assert not self.deal_in_progress and not self.finished
+
+        cards = self.rng.sample(CARD_BITS, self.cards_in_play())
+        events = []
+        start = 0
+        for index, count in enumerate(self.hand_counts):
+            mask = 0
+            for card in cards[start:start + count]:
+                mask |= card
+            start += count
+            self.hands[index] = mask
+            sid = self.players[index]
+            events.append(Event("deal", to = sid, sid = sid, value = mask))
+
+        self.last_bet = None
+        self.deal_in_progress = True
+        return events
+
+    def bet(self, sid: str, bet: int) -> List[Event]:
+        if self.players[self.turn] != sid:
+            return [Event("not_your_turn", to = sid)]
+        if not 0 <= bet < len(COMBINATIONS):
+            return [Event("invalid_bet", to = sid)]
+        if self.last_bet is not None and self.last_bet >= bet:
+            return [Event("bet_too_low", to = sid)]
+
+        self.last_bet = bet
+        self.turn = (self.turn + 1) % len(self.players)
+        return [Event("bet", sid = sid, value = bet)]
+
+    def check(self, sid: str) -> List[Event]:
+        if self.players[self.turn] != sid:
+            return [Event("not_your_turn", to = sid)]
+        if self.last_bet is None:
+            return [Event("first_turn_check", to = sid)]
+
+        # The checker loses when the last bet is on the table
+        loser = self.turn
+        if not self.bet_holds(self.last_bet):
+            loser = (self.turn - 1) % len(self.players)
+
+        return [Event("check", sid = sid), *self.finish_deal(loser)]
+
+    def finish_deal(self, loser: int) -> List[Event]:
+        sid = self.players[loser]
+        self.hand_counts[loser] += 1
+        events = [Event("lost", sid = sid)]
+
+        if self.hand_counts[loser] > MAX_CARDS:
+            events.append(Event("out", sid = sid))
+            self.remove(loser)
+
+        if len(self.players) <= 1:
+            events.append(Event("won", sid = self.players[0]))
+            self.finished = True
+            return events
+
+        self.turn = loser % len(self.players)
+        self.deal_in_progress = False
+        return events
+
+    def forfeit(self, sid: str) -> List[Event]:
+        if sid not in self.players:
+            return []
+        index = self.players.index(sid)
+        events = [Event("left", sid = sid)]
+        self.remove(index)
+
+        if len(self.players) <= 1:
+            if self.players:
+                events.append(Event("won", sid = self.players[0]))
+            self.finished = True
+            return events
+
+        if index < self.turn:
+            self.turn -= 1
+        self.turn %= len(self.players)
+
+        # The leaver's cards were part of the deal, so deal again.
+        self.deal_in_progress = False
+        return events
+
+    def remove(self, index: int):
+        del self.players[index]
+        del self.hand_counts[index]
+        del self.hands[index]
+
+    # SERIALIZATION
+
+    def to_state(self) -> list:
+        return [
+            self.sids,
+            [[sid, count, hand] for sid, count, hand in zip(self.players, self.hand_counts, self.hands)],
+            self.turn,
+            self.last_bet,
+            self.deal_in_progress,
+            self.finished,
+            self.rng.to_state() if isinstance(self.rng, Stream) else None,
+        ]
+
+    @classmethod
+    def from_state(cls, state: list, rng = random) -> "Engine":
+        sids, players, turn, last_bet, deal_in_progress, finished, *stream = state
+        if stream and stream[0] is not None:
+            rng = Stream(*stream[0])  # the room's own deal stream, where it left off
+        engine = cls(sids, rng)
+        engine.players = [sid for sid, _, _ in players]
+        engine.hand_counts = [count for _, count, _ in players]
+        engine.hands = [hand for _, _, hand in players]
+        engine.turn = turn
+        engine.last_bet = last_bet
+        engine.deal_in_progress = deal_in_progress
+        engine.finished = finished
+        return engine
@@ -1,188 +1,174 @@
-from typing import List, Dict
-from Deck import Deck
-from collections import namedtuple
-from flask_socketio import emit
+from typing import List
 import random
+import json
+
+from Engine import Engine, Event
+from eventlog import event_log
+from registry import BY_NAME, COMBINATIONS
+from Hand import Hand
+from outbox import outbox
+from logs import SampledLogger
+from metrics import Counter, Histogram
+
+log = SampledLogger("liars_poker.game")
+
+MOVES = Counter("liars_poker_moves_total", "Bets and checks accepted", ("kind",))
+INVALID_MOVES = Counter("liars_poker_invalid_moves_total", "Moves rejected by the rules", ("reason",))
+DEAL_SECONDS = Histogram("liars_poker_deal_seconds", "Time to deal and send a new hand")
+
+INVALID = {"not_your_turn", "first_turn_check", "invalid_bet", "bet_too_low"}
+
+TEXTS = {
+    "not_your_turn": "Not your turn!",
+    "first_turn_check": "You can't check on first turn. Place a bet.",
+    "invalid_bet": "Invalid bet. Try again.",
+    "bet_too_low": "Your bet must be higher than the last one. Try again.",
+    "bet": "Player {sid} bets {bet}",
+    "check": "Player {sid} checks!",
+    "lost": "Player {sid} lost the deal!",
+    "out": "Player {sid} is out!",
+    "won": "Player {sid} won!",
+    "left": "Player {sid} left the game!",
+}
 
-from Solver import Solver, combinations# Player = namedtuple("Player", ["name", "hand", "solver"])
 
 class Player:
-    def __init__(self, sid, hand_count, hand=None, solver=None):
+    def __init__(self, sid, hand_count, hand=None):
         self.sid = sid
         self.hand_count = hand_count
         self.hand = hand
-        self.solver = solver
-        
+
     def __repr__(self) -> str:
-        return f"Player(sid={self.sid}, hand_count={self.hand_count}, hand={self.hand}, solver={self.solver})"
-    
+        return f"Player(sid={self.sid}, hand_count={self.hand_count}, hand={self.hand})"
+
 
 class Game:
-    
-    def __init__(self, sids: List[str], room: str):
-        
+    # Socket.IO adapter around an Engine: turns bet names into bet ids and
+    # the engine's events into the messages the client expects.
+
+    def __init__(self, sids: List[str], room: str, rng = random):
+
         self.room = room
-        self.sids = sids
-            
-        self.players: List[Player] = [
-            Player(
-                sid = sid,
-                hand_count = 1,
-                hand = None,
-                solver = None
-            )
-            for sid in sids
-        ]
-        
-        self.player_turn_index = 0
-        
-        self.deal_in_progess = False
-        self.game_finished = False
-        
-        self.emit('game_start', {'players': sids})
-        
+        self.engine = Engine(sids, rng)
+
+        self.send(self.engine.start())
+
     def emit(self, event, data = {}, to = None):
-        
+
         if to is None:
             to = self.room
-        
-        print(f"Emmiting {data} to {to}")
-        
-        emit(event, data, to = to)
 
+        log.debug("emit", event = event, to = to, data = data)
+
+        outbox.add(event, data, to = to)
+
+    def send(self, events: List[Event]):
+
+        event_log.record(self.room, self.engine, events)
+
+        for event in events:
+
+            if event.kind in ("bet", "check"):
+                MOVES.inc(event.kind)
+            elif event.kind in INVALID:
+                INVALID_MOVES.inc(event.kind)
+
+            if event.kind == "start":
+                self.emit('game_start', {'room': self.room, 'players': event.value})
+
+            elif event.kind == "deal":
+                hand = Hand(event.value).cards()
+                player_hand_counts = dict(zip(self.engine.players, self.engine.hand_counts))
+                self.emit('game_update', {
+                    'text': f"New deal! your hand: {hand} | {player_hand_counts=}",
+                    'room': self.room,
+                    'kind': 'deal',
+                    'your_hand': hand,
+                    'player_hand_counts': player_hand_counts,
+                    'turn': self.engine.players[self.engine.turn]
+                }, to = event.to)
+
+            else:
+                # room, kind, sid, bet and turn let scripted clients follow the game without parsing text
+                bet = None if event.value is None else COMBINATIONS[event.value].name
+                data = {'text': TEXTS[event.kind].format(sid = event.sid, bet = bet), 'room': self.room, 'kind': event.kind, 'sid': event.sid}
+                if event.kind == "bet":
+                    data['bet'] = bet
+                    data['turn'] = self.engine.players[self.engine.turn]
+                self.emit('game_update', data, to = event.to)
+
+    # STATE
+
+    @property
+    def sids(self) -> List[str]:
+        return self.engine.sids
+
+    @property
+    def player_sids(self) -> List[str]:
+        # Still at the table, in turn order
+        return list(self.engine.players)
+
+    @property
+    def players(self) -> List[Player]:
+        return [
+            Player(sid = sid, hand_count = hand_count, hand = Hand(hand).cards() if hand else None)
+            for sid, hand_count, hand in zip(self.engine.players, self.engine.hand_counts, self.engine.hands)
+        ]
+
+    @property
+    def player_turn_index(self) -> int:
+        return self.engine.turn
+
+    @property
+    def last_bet(self):
+        return None if self.engine.last_bet is None else COMBINATIONS[self.engine.last_bet].name
+
+    @property
+    def deal_in_progess(self) -> bool:
+        return self.engine.deal_in_progress
+
+    @property
+    def game_finished(self) -> bool:
+        return self.engine.finished
+
+    # ACTIONS
+
+    @DEAL_SECONDS.time()
     def deal(self):
-        
-        assert not self.deal_in_progess
-    
-        hands = Deck().get_hands([player.hand_count for player in self.players])
-        
-        self.cards = Deck.from_hands(hands)
-        n = len(self.cards.cards)
-        
-        # print([n for n in self.cards.combinations.keys()])
-        player_hand_counts = { p.sid: p.hand_count for p in self.players}
-        
-        for player, hand in zip(self.players, hands):
-            player.hand = hand
-            player.solver = Solver(hand, n)
-            
-        for p in self.players:
-        
-            self.emit('game_update', {
-                'text': f"New deal! your hand: {p.hand} | {player_hand_counts=}",
-                'your_hand': p.hand,
-                'player_hand_counts': player_hand_counts
-            }, to = p.sid)
-        
-        self.last_bet = None
-        
-        self.deal_in_progess = True
-        
-        return
+        self.send(self.engine.deal())
 
     def make_move(self, sid: str, bet: str):
-                
-        current_player = self.players[self.player_turn_index]
-        
-        if current_player.sid != sid:
-        
-            self.emit('game_update', {
-                'text': "Not your turn!"
-            }, to = sid)
-            
-            return
-        
+
         if bet == "check":
-            if self.last_bet is None:
-        
-                self.emit('game_update', {
-                    'text': "You can't check on first turn. Place a bet."
-                }, to = sid)
-                
-                return
-        
-            self.emit('game_update', {
-                'text': f"Player {current_player.sid} checks!"
-            })
-                    
-            loser_player_index = self.player_turn_index
-            if not self.cards.combinations[self.last_bet]:
-                loser_player_index = (self.player_turn_index - 1) % len(self.players)
-            
-            self.finish_deal(loser_player_index)
-            return
-        
-        if bet not in self.cards.combinations:
-        
-            self.emit('game_update', {
-                'text': "Invalid bet. Try again."
-            }, to = sid)
-            
-            return
-        
-        def is_bet_higher(bet: str) -> bool:
-            def bet_index(bet: str):
-                return list(self.cards.combinations.keys()).index(bet)
-            if self.last_bet is not None and bet_index(self.last_bet) >= bet_index(bet):
-                return False
-            return True
-        
-        if not is_bet_higher(bet):
-        
-            self.emit('game_update', {
-                'text': "Your bet must be higher than the last one. Try again."
-            }, to = sid)
-            
-            return
-        
-        self.last_bet = bet
-        self.player_turn_index = (self.player_turn_index + 1) % len(self.players)
-        
-        self.emit('game_update', {
-            'text': f"Player {current_player.sid} bets {bet}"
-        })
-        
-        return
-
-    def finish_deal(self, loser_player_index = None):
-        
-        loser = self.players[loser_player_index]
-        loser.hand_count += 1
-        MAX_CARDS = 3
-        
-        self.emit('game_update', {
-            'text': f"Player {loser.sid} lost the deal!"
-        })
-        
-        player_cards = [[p.sid, p.hand] for p in self.players]
-        
-        if loser.hand_count > MAX_CARDS:
-        
-            self.emit('game_update', {
-                'text': f"Player {loser.sid} is out!"
-            })
-            
-            del self.players[loser_player_index]
-            
-        if len(self.players) <= 1:
-            winner = self.players[0]
-            self.emit('game_update', {
-                'text': f"Player {winner.sid} won!"
-            })
-            self.game_finished = True
-            return
-            
-        
-        self.player_turn_index = loser_player_index % len(self.players)
-        
-        self.deal_in_progess = False
-        
-        return
-
-    def end(self):
-        pass
-        
+            self.send(self.engine.check(sid))
+        elif bet not in BY_NAME:
+            if self.engine.players[self.engine.turn] != sid:
+                self.send([Event("not_your_turn", to = sid)])
+            else:
+                self.send([Event("invalid_bet", to = sid)])
+        else:
+            self.send(self.engine.bet(sid, BY_NAME[bet].id))
+
+    def forfeit(self, sid: str):
+        self.send(self.engine.forfeit(sid))
+
+    # SERIALIZATION
+
+    def to_state(self) -> bytes:
+        return json.dumps([self.room, *self.engine.to_state()], separators=(',', ':')).encode()
+
+    @classmethod
+    def from_state(cls, state: bytes) -> "Game":
+        room, *engine_state = json.loads(state)
+
+        # Restores a game without emitting game_start again
+        game = cls.__new__(cls)
+        game.room = room
+        game.engine = Engine.from_state(engine_state)
+        return game
+
 if __name__ == "__main__":
     player_ids = ["A", "B", "C"]
-    game = Game(player_ids) # Initialize a game with 3 players
-    game.deal()
\ No newline at end of file
+    game = Game(player_ids, room = "local") # Initialize a game with 3 players
+    game.deal()
+    outbox.flush(lambda event, data, to: print(to, data))
@@ -0,0 +1,58 @@
+from contextlib import contextmanager
+from typing import List, Optional
+
+from Game import Game
+from state import MemoryBackend
+
+
+class GameRegistry:
+    # Live games indexed by room and by player sid, kept in a state backend
+    # that may be shared with other workers. A game is only touched inside
+    # game() / game_for(), which hold the room's lock and store the game
+    # back (or drop it once finished).
+
+    def __init__(self, backend = None):
+        self.backend = MemoryBackend() if backend is None else backend
+
+    def add(self, game: Game):
+        with self.backend.locked(game.room):
+            self.backend.save(game)
+
+    def add_many(self, games: List[Game]):
+        # New rooms nobody else can know about yet, so no room locks
+        self.backend.save_many(games)
+
+    def in_game(self, sid: str) -> bool:
+        return self.backend.room_for(sid) is not None
+
+    @contextmanager
+    def game(self, room: Optional[str]):
+        if room is None:
+            yield None
+            return
+        with self.backend.locked(room):
+            game = self.backend.load(room)
+            yield game
+            if game is None:
+                return
+            if game.game_finished:
+                self.backend.delete(room)
+            else:
+                self.backend.save(game)
+
+    def game_for(self, sid: str):
+        return self.game(self.backend.room_for(sid))
+
+    def remove_player(self, sid: str):
+        # The game the player was in, with the player no longer indexed
+        return self.game(self.backend.remove_sid(sid))
+
+    def close(self, room: str) -> bool:
+        with self.backend.locked(room):
+            return self.backend.delete(room)
+
+    def idle_rooms(self, timeout: float) -> List[str]:
+        return self.backend.idle_rooms(timeout)
+
+    def __len__(self):
+        return len(self.backend)
@@ -0,0 +1,126 @@
+import itertools
+from functools import lru_cache
+from typing import Iterable, List, Tuple
+
+from Card import Card
+
+from helpers import (
+    RANKS,
+    SUITS,
+    SMALL_STRAIGHT_RANKS,
+    BIG_STRAIGHT_RANKS,
+    TOTAL_CARDS_NUM,
+)
+
+# Each card is a single bit: index = rank_index * len(SUITS) + suit_index,
+# which is the same order as Deck.get_all_cards().
+
+RANK_INDEX = {rank: i for i, rank in enumerate(RANKS)}
+SUIT_INDEX = {suit: i for i, suit in enumerate(SUITS)}
+
+
+def card_index(rank: str, suit: str) -> int:
+    return RANK_INDEX[rank] * len(SUITS) + SUIT_INDEX[suit]
+
+
+def card_bit(card: Card) -> int:
+    return 1 << card_index(card.rank, card.suit)
+
+
+FULL_MASK = (1 << TOTAL_CARDS_NUM) - 1
+
+RANK_MASKS = {rank: sum(1 << card_index(rank, suit) for suit in SUITS) for rank in RANKS}
+SUIT_MASKS = {suit: sum(1 << card_index(rank, suit) for rank in RANKS) for suit in SUITS}
+
+SMALL_POKER_MASKS = {suit: sum(1 << card_index(rank, suit) for rank in SMALL_STRAIGHT_RANKS) for suit in SUITS}
+BIG_POKER_MASKS = {suit: sum(1 << card_index(rank, suit) for rank in BIG_STRAIGHT_RANKS) for suit in SUITS}
+
+SMALL_STRAIGHT_MASKS = [RANK_MASKS[rank] for rank in RANKS if rank in SMALL_STRAIGHT_RANKS]
+BIG_STRAIGHT_MASKS = [RANK_MASKS[rank] for rank in RANKS if rank in BIG_STRAIGHT_RANKS]
+
+# rank counts, suit counts, small poker counts, big poker counts
+FEATURE_MASKS = [
+    *RANK_MASKS.values(),
+    *SUIT_MASKS.values(),
+    *SMALL_POKER_MASKS.values(),
+    *BIG_POKER_MASKS.values(),
+]
+
+CARDS = [Card(rank, suit) for rank in RANKS for suit in SUITS]
+
+# perm[old_suit_index] = new_suit_index
+SUIT_PERMUTATIONS = list(itertools.permutations(range(len(SUITS))))
+
+
+def permute_suits(mask: int, perm: Tuple[int, ...]) -> int:
+    result = 0
+    while mask:
+        bit = mask & -mask
+        rank_index, suit_index = divmod(bit.bit_length() - 1, len(SUITS))
+        result |= 1 << (rank_index * len(SUITS) + perm[suit_index])
+        mask ^= bit
+    return result
+
+
+@lru_cache(maxsize=1 << 16)
+def canonicalize(mask: int) -> Tuple[int, Tuple[int, ...]]:
+    # Smallest mask reachable by relabelling suits, and the relabelling used.
+    return min((permute_suits(mask, perm), perm) for perm in SUIT_PERMUTATIONS)
+
+
+class Hand:
+
+    __slots__ = ("mask",)
+
+    def __init__(self, mask: int = 0):
+        self.mask = mask
+
+    @staticmethod
+    def from_cards(cards: Iterable[Card]) -> "Hand":
+        mask = 0
+        for card in cards:
+            mask |= card_bit(card)
+        return Hand(mask)
+
+    def cards(self) -> List[Card]:
+        return [card for i, card in enumerate(CARDS) if self.mask >> i & 1]
+
+    def complement(self) -> "Hand":
+        return Hand(FULL_MASK & ~self.mask)
+
+    def count_rank(self, rank: str) -> int:
+        return (self.mask & RANK_MASKS[rank]).bit_count()
+
+    def count_suit(self, suit: str) -> int:
+        return (self.mask & SUIT_MASKS[suit]).bit_count()
+
+    def small_poker_count(self, suit: str) -> int:
+        return (self.mask & SMALL_POKER_MASKS[suit]).bit_count()
+
+    def big_poker_count(self, suit: str) -> int:
+        return (self.mask & BIG_POKER_MASKS[suit]).bit_count()
+
+    def features(self) -> List[int]:
+        return [(self.mask & feature_mask).bit_count() for feature_mask in FEATURE_MASKS]
+
+    def has_all_ranks(self, rank_masks: List[int]) -> bool:
+        return all(self.mask & rank_mask for rank_mask in rank_masks)
+
+    def __len__(self):
+        return self.mask.bit_count()
+
+    def __contains__(self, card: Card):
+        return bool(self.mask & card_bit(card))
+
+    def __hash__(self):
+        return hash(self.mask)
+
+    def __eq__(self, other):
+        assert isinstance(other, Hand)
+        return self.mask == other.mask
+
+    def __str__(self):
+        return f"Hand({self.cards()})"
+
+    def __repr__(self):
+        return f"Hand({self.cards()})"
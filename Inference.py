@@ -0,0 +1,130 @@
+import itertools
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from Card import Card
+from Hand import Hand
+from helpers import TOTAL_CARDS_NUM, binomial
+from registry import COMBINATIONS, FEATURES_NUM, evaluate, feature_matrix
+
+# REQUIRED[bet, feature] = cards of that feature the combination needs
+REQUIRED = np.zeros((len(COMBINATIONS), FEATURES_NUM), dtype=np.int8)
+for combination in COMBINATIONS:
+    for feature, count in combination.conditions:
+        REQUIRED[combination.id, feature] = count
+
+# Candidates are drawn in two steps, a block of BLOCK hands then a hand
+# within it, so a draw never runs a cumulative sum over all C weights.
+BLOCK = 64
+
+# (features (C, FEATURES_NUM) of every candidate hand, bet id, last bet id or None)
+# -> (C,) relative likelihood of that bet being made from each hand
+Likelihood = Callable[[np.ndarray, int, Optional[int]], np.ndarray]
+
+
+class SupportLikelihood:
+    # Players tend to bet on what they hold: the likelihood grows with the
+    # share of the bet's required cards already in the bettor's hand, and
+    # floor keeps bluffs possible.
+
+    def __init__(self, floor: float = 0.25):
+        self.floor = floor
+
+    def __call__(self, features: np.ndarray, bet: int, last_bet: Optional[int]) -> np.ndarray:
+        required = REQUIRED[bet]
+        held = np.minimum(features, required).sum(axis = 1)
+        return self.floor + held / required.sum()
+
+
+@lru_cache(maxsize = 256)
+def candidates(excluded: int, size: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Every hand of size cards avoiding the excluded mask, as (C,) int64
+    # masks and (C, FEATURES_NUM) int8 feature counts. C is padded up to a
+    # multiple of BLOCK with empty hands, which get zero weight.
+    free = [i for i in range(TOTAL_CARDS_NUM) if not excluded >> i & 1]
+    indices = np.array(list(itertools.combinations(free, size)), dtype=np.int64).reshape(-1, size)
+    padded = -(-len(indices) // BLOCK) * BLOCK
+    masks = np.zeros(padded, dtype=np.int64)
+    masks[:len(indices)] = np.bitwise_or.reduce(np.left_shift(1, indices), axis = 1)
+    in_hand = np.zeros((padded, TOTAL_CARDS_NUM), dtype=np.float32)
+    np.put_along_axis(in_hand[:len(indices)], indices, 1, axis = 1)
+    features = (in_hand @ feature_matrix()).astype(np.int8)
+    masks.setflags(write = False)
+    features.setflags(write = False)
+    return masks, features
+
+
+class Inference:
+    # Posterior over each opponent's hand given the bets they made. Each
+    # opponent keeps one weight per candidate hand (at most C(23, 3) = 1771);
+    # a bet multiplies the bettor's weights by the likelihood model, so an
+    # update is a single vector product.
+    #
+    # Opponents' hands cannot overlap, so combination probabilities come
+    # from sequential importance sampling: opponents are drawn in turn from
+    # their posterior restricted to cards still free, and each joint sample
+    # is weighted by the restricted posterior masses.
+
+    def __init__(
+        self,
+        hand: List[Card],
+        hand_counts: Dict[str, int],
+        likelihood: Likelihood = None,
+        samples: int = 1024,
+        seed: int = None,
+    ):
+        self.hand = Hand.from_cards(hand)
+        assert len(self.hand) + sum(hand_counts.values()) <= TOTAL_CARDS_NUM
+
+        self.likelihood = SupportLikelihood() if likelihood is None else likelihood
+        self.samples = samples
+        self.rng = np.random.default_rng(seed)
+
+        self.masks: Dict[str, np.ndarray] = {}
+        self.features: Dict[str, np.ndarray] = {}
+        self.weights: Dict[str, np.ndarray] = {}
+        for sid, count in hand_counts.items():
+            self.masks[sid], self.features[sid] = candidates(self.hand.mask, count)
+            hands = binomial(TOTAL_CARDS_NUM - len(self.hand), count)
+            self.weights[sid] = np.zeros(len(self.masks[sid]))
+            self.weights[sid][:hands] = 1 / hands
+
+    def observe(self, sid: str, bet: int, last_bet: Optional[int] = None):
+        weights = self.weights[sid] * self.likelihood(self.features[sid], bet, last_bet)
+        self.weights[sid] = weights / weights.sum()
+
+    def posterior(self, sid: str) -> Tuple[np.ndarray, np.ndarray]:
+        # (candidate hand masks, posterior weights)
+        return self.masks[sid], self.weights[sid]
+
+    def sample(self) -> Tuple[np.ndarray, np.ndarray]:
+        # (samples, FEATURES_NUM) table feature counts and their weights
+        features = np.tile(np.array(self.hand.features(), dtype=np.int8), (self.samples, 1))
+        used = np.zeros(self.samples, dtype=np.int64)
+        importance = np.ones(self.samples)
+
+        rows = np.arange(self.samples)
+        for sid, weights in self.weights.items():
+            blocks = len(weights) // BLOCK
+            free = np.where((self.masks[sid][None, :] & used[:, None]) == 0, weights, 0.0).reshape(self.samples, blocks, BLOCK)
+            block_cumulative = np.cumsum(free.sum(axis = 2), axis = 1)
+            mass = block_cumulative[:, -1]
+            target = self.rng.random(self.samples) * mass
+
+            block = np.minimum((block_cumulative < target[:, None]).sum(axis = 1), blocks - 1)
+            target -= np.where(block > 0, block_cumulative[rows, block - 1], 0.0)
+            within = np.cumsum(free[rows, block], axis = 1)
+            picks = block * BLOCK + np.minimum((within < target[:, None]).sum(axis = 1), BLOCK - 1)
+
+            importance *= mass
+            used |= self.masks[sid][picks]
+            features += self.features[sid][picks]
+
+        return features, importance
+
+    def probabilities(self) -> np.ndarray:
+        # Posterior probability of every combination being on the table
+        features, importance = self.sample()
+        return importance @ evaluate(features) / importance.sum()
@@ -0,0 +1,126 @@
+import argparse
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List
+
+MIN_TABLE_SIZE = 2
+MAX_TABLE_SIZE = 6  # up to MAX_CARDS = 3 cards each still leaves a deck to bet on
+
+WAITS_KEPT = 10_000
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Matchmaker:
+    # One FIFO queue of waiting sids, cut into tables by match() on a timer.
+    # Full tables are formed right away; a short table is only formed once
+    # its oldest player has waited max_wait seconds. Every queue operation
+    # is O(1).
+
+    def __init__(
+        self,
+        table_size: int = 2,
+        min_table_size: int = MIN_TABLE_SIZE,
+        max_wait: float = 10.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        assert MIN_TABLE_SIZE <= min_table_size <= table_size <= MAX_TABLE_SIZE
+        self.table_size = table_size
+        self.min_table_size = min_table_size
+        self.max_wait = max_wait
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.queue: "OrderedDict[str, float]" = OrderedDict()  # sid -> time enqueued
+        self.waits = deque(maxlen = WAITS_KEPT)  # seconds from enqueue to match, latest
+        self.matched = 0
+
+    def enqueue(self, sid: str) -> bool:
+        with self.lock:
+            if sid in self.queue:
+                return False
+            self.queue[sid] = self.clock()
+            return True
+
+    def cancel(self, sid: str) -> bool:
+        with self.lock:
+            return self.queue.pop(sid, None) is not None
+
+    def __contains__(self, sid: str) -> bool:
+        return sid in self.queue
+
+    def __len__(self):
+        return len(self.queue)
+
+    def pop_table(self, size: int, now: float) -> List[str]:
+        table = []
+        for _ in range(size):
+            sid, enqueued = self.queue.popitem(last = False)
+            self.waits.append(now - enqueued)
+            table.append(sid)
+        self.matched += size
+        return table
+
+    def match(self) -> List[List[str]]:
+        # Every table that can be formed now, oldest players first.
+        with self.lock:
+            now = self.clock()
+            tables = []
+            while len(self.queue) >= self.table_size:
+                tables.append(self.pop_table(self.table_size, now))
+            if len(self.queue) >= self.min_table_size and now - next(iter(self.queue.values())) >= self.max_wait:
+                tables.append(self.pop_table(len(self.queue), now))
+            return tables
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            waits = sorted(self.waits)
+            oldest = self.clock() - next(iter(self.queue.values())) if self.queue else 0.0
+            return {
+                "queue_depth": len(self.queue),
+                "oldest_wait": oldest,
+                "matched": self.matched,
+                "time_to_match_p50": percentile(waits, 0.50),
+                "time_to_match_p95": percentile(waits, 0.95),
+                "time_to_match_p99": percentile(waits, 0.99),
+            }
+
+
+if __name__ == "__main__":
+    # Replays bursty arrivals against a simulated clock.
+    parser = argparse.ArgumentParser(description="Simulate bursty matchmaking and report queue depth and time to match.")
+    parser.add_argument("--players", type=int, default=100_000)
+    parser.add_argument("--table-size", type=int, default=4)
+    parser.add_argument("--min-table-size", type=int, default=MIN_TABLE_SIZE)
+    parser.add_argument("--max-wait", type=float, default=10.0)
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between match() calls")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    now = [0.0]
+    matchmaker = Matchmaker(args.table_size, args.min_table_size, args.max_wait, clock = lambda: now[0])
+
+    arrived = 0
+    max_depth = 0
+    tables = 0
+    start = time.perf_counter()
+    while arrived < args.players or len(matchmaker) >= args.min_table_size:
+        # Quiet periods with a trickle of players, broken by bursts
+        burst = rng.random() < 0.05
+        for _ in range(min(args.players - arrived, rng.randint(50, 500) if burst else rng.randint(0, 3))):
+            matchmaker.enqueue(f"player-{arrived}")
+            arrived += 1
+        max_depth = max(max_depth, len(matchmaker))
+        tables += len(matchmaker.match())
+        now[0] += args.interval
+    seconds = time.perf_counter() - start
+
+    print(f"{arrived} players, {tables} tables in {seconds:.2f}s, max queue depth {max_depth}")
+    for name, value in matchmaker.stats().items():
+        print(f"{name:20} {value:.2f}")
@@ -1,19 +1,9 @@
-import pandas as pd
-import numpy as np
-from tqdm import tqdm
-import itertools
-import random
-from typing import List, Dict
-from functools import partial
-import pickle
-import math
-from math import comb
-import re
+from typing import List, Dict, Union
+from functools import lru_cache
+from fractions import Fraction
+import time
 from collections import namedtuple
 
-pd.set_option("display.max_rows", 83)
-pd.set_option("display.max_columns", 83)
-
 
 from helpers import (
     RANKS,
@@ -25,25 +15,98 @@ from helpers import (
     EACH_RANK_COUNT,
     EACH_SUIT_COUNT,
     RANK_PAIRS_DESCENDING,
+    binomial,
 )
 from Card import Card
 
 from Deck import Deck
-from simulate import init_counts
+from Hand import Hand, canonicalize
+from counting import ways_at_least
+from registry import COMBINATIONS, BY_NAME, suit_permutation_index
+import metrics
+
+# numpy is only imported once probabilities are computed, so importing the
+# Solver (and what imports it) stays cheap.
+
+SOLVER_SECONDS = metrics.Histogram("liars_poker_solver_seconds", "Solver time per compute_probabilities pass, by combination family", ("family",))
+
+# COMBINATIONS grouped by family, in bet order
+FAMILIES: Dict[str, list] = {}
+for c in COMBINATIONS:
+    FAMILIES.setdefault(c.family, []).append(c)
 
 
 class Solver:
     def __init__(
         self,
         hand: List[Card],
-        cards_in_play_num: int
+        cards_in_play_num: int,
+        exact: bool = False
     ):
         assert cards_in_play_num >= len(hand)
         assert cards_in_play_num <= TOTAL_CARDS_NUM
         
         self.hand = Deck(hand)
-        self.deck = Deck([card for card in Deck.get_all_cards() if card not in self.hand.cards])
+        self.deck = Deck.from_hand(self.hand.hand.complement())
         self.n = cards_in_play_num - len(hand)
+        self.cards_in_play_num = cards_in_play_num
+        self.ways_total = binomial(len(self.deck.cards), self.n)
+        self.exact = exact
+
+    def probabilities(self) -> "np.ndarray":
+        # Suit-isomorphic hands share one cached vector, permuted back here.
+        # Exact solvers are not cached and compute theirs.
+        if self.exact:
+            return self.compute_probabilities()
+        return hand_probabilities(self.hand.hand.mask, self.cards_in_play_num)
+
+    def probability(self, name: str) -> Union[float, Fraction]:
+        c = BY_NAME[name]
+        if self.exact:
+            return getattr(self, c.probability)(**c.kwargs)
+        return float(self.probabilities()[c.id])
+
+    def lookup_probabilities(self) -> "np.ndarray":
+        # Answers from the precomputed (float) table when it covers this hand.
+        if self.exact:
+            return self.compute_probabilities()
+        from probability_table import get_table
+        table = get_table()
+        if table is not None and table.covers(self.hand.hand):
+            return table.lookup(self.hand.hand, self.cards_in_play_num)
+        return self.compute_probabilities()
+
+    def compute_probabilities(self) -> "np.ndarray":
+        # One pass over every combination; the hand/deck histograms, binomial
+        # table and ways_total are shared by all of them. Exact solvers give
+        # an object array of Fractions.
+        import numpy as np
+        dtype = object if self.exact else np.float64
+        if not metrics.exporting:
+            return np.fromiter(
+                (getattr(self, c.probability)(**c.kwargs) for c in COMBINATIONS),
+                dtype=dtype, count=len(COMBINATIONS)
+            )
+        probabilities = np.empty(len(COMBINATIONS), dtype=dtype)
+        for family, combinations in FAMILIES.items():
+            start = time.perf_counter()
+            for c in combinations:
+                probabilities[c.id] = getattr(self, c.probability)(**c.kwargs)
+            SOLVER_SECONDS.observe(time.perf_counter() - start, family)
+        return probabilities
+
+    @staticmethod
+    def probabilities_many(hands: List[List[Card]], cards_in_play_num: int) -> "np.ndarray":
+        # Rows aligned with hands; each suit-isomorphic class is solved once.
+        import numpy as np
+        canonical = [canonicalize(Hand.from_cards(hand).mask) for hand in hands]
+        ids = {}
+        for mask, _ in canonical:
+            ids.setdefault(mask, len(ids))
+        vectors = np.stack([canonical_probabilities(mask, cards_in_play_num) for mask in ids])
+        rows = np.array([ids[mask] for mask, _ in canonical])
+        columns = np.array([suit_permutation_index(perm) for _, perm in canonical])
+        return vectors[rows[:, None], columns]
     
     def __probabilty_n_ranks(self, rank_need_dict: Dict[str, int]):
         
@@ -60,23 +123,19 @@ class Solver:
             return 0
         
         ranks = rank_need_real_dict.keys()
-        
-        # Create a list of ranges for each key in the dictionary
-        ranges = [range(need_real,  EACH_RANK_COUNT + 1) for need_real in rank_need_real_dict.values()]
-        # Use itertools.product to generate all combinations of the ranges
-        combinations = list(itertools.product(*ranges))
-        # Create the resulting list of dictionaries
-        rank_num_dict_list = [dict(zip(ranks, combo)) for combo in combinations]
-    
-        ways_positive = 0
-        for rank_num_dict in rank_num_dict_list:
-            ways_positive += self.deck.ways_ranks_nums(self.n, rank_num_dict)
+        available = [self.deck.count_rank(rank) for rank in ranks]
+        others = len(self.deck.cards) - sum(available)
+
+        ways_positive = ways_at_least(list(rank_need_real_dict.values()), available, others, self.n)
         
         assert ways_positive > 0
         
-        ways_total = self.deck.total_ways(self.n)
-        
-        return ways_positive / ways_total
+        return self.__ratio(ways_positive)
+    
+    def __ratio(self, ways_positive: int):
+        if self.exact:
+            return Fraction(ways_positive, self.ways_total)
+        return ways_positive / self.ways_total
     
     def probability_flush(self, suit):
         
@@ -96,9 +155,7 @@ class Solver:
         
         assert ways_positive > 0
         
-        ways_total = self.deck.total_ways(self.n)
-        
-        return ways_positive / ways_total
+        return self.__ratio(ways_positive)
     
     def probability_small_poker(self, suit):
         
@@ -113,9 +170,7 @@ class Solver:
         
         ways_positive = self.deck.ways_small_poker(self.n, suit, need_real)
         
-        ways_total = self.deck.total_ways(self.n)
-        
-        return ways_positive / ways_total 
+        return self.__ratio(ways_positive) 
        
     def probability_big_poker(self, suit):
         
@@ -132,9 +187,7 @@ class Solver:
         
         ways_positive = self.deck.ways_big_poker(self.n, suit, need_real)
         
-        ways_total = self.deck.total_ways(self.n)
-        
-        return ways_positive / ways_total
+        return self.__ratio(ways_positive)
     
     def probability_high_card(self, rank):
         return self.__probabilty_n_ranks({
@@ -188,15 +241,24 @@ class Solver:
 
 Combination = namedtuple("Combination", ["name", "method", "kwargs"])
 
-combinations = []
-combinations.extend([Combination(f"high_card_{rank}", "probability_high_card", {"rank": rank}) for rank in RANKS])
-combinations.extend([Combination(f"pair_{rank}", "probability_pair", {"rank": rank}) for rank in RANKS])
-combinations.extend([Combination(f"two_pair_{a}_{b}", "probability_two_pair", {"rank_a": a, "rank_b": b}) for a, b in RANK_PAIRS_DESCENDING])
-combinations.extend([Combination(f"small_straight", "probability_small_straight", {})])
-combinations.extend([Combination(f"big_straight", "probability_big_straight", {})])
-combinations.extend([Combination(f"three_{rank}", "probability_three", {"rank": rank}) for rank in RANKS])
-combinations.extend([Combination(f"full_{a}_{b}", "probability_full", {"rank_a": a, "rank_b": b}) for a, b in RANK_PAIRS])
-combinations.extend([Combination(f"quad_{rank}", "probability_quad", {"rank": rank}) for rank in RANKS])
-combinations.extend([Combination(f"flush_{suit}", "probability_flush", {"suit": suit}) for suit in SUITS])
-combinations.extend([Combination(f"small_poker_{suit}",  "probability_small_poker", {"suit": suit}) for suit in SUITS])
-combinations.extend([Combination(f"big_poker_{suit}", "probability_big_poker", {"suit": suit}) for suit in SUITS])
+# (name, Solver method, kwargs) view of the registry, in bet order
+combinations = [Combination(c.name, c.probability, c.kwargs) for c in COMBINATIONS]
+
+PROBABILITIES_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=PROBABILITIES_CACHE_SIZE)
+def canonical_probabilities(mask: int, cards_in_play_num: int) -> "np.ndarray":
+    probabilities = Solver(Hand(mask).cards(), cards_in_play_num).lookup_probabilities()
+    probabilities.setflags(write=False)
+    return probabilities
+
+
+def hand_probabilities(mask: int, cards_in_play_num: int) -> "np.ndarray":
+    # Solver(...).probabilities() for a hand bitmask, without building a Solver
+    mask, perm = canonicalize(mask)
+    return canonical_probabilities(mask, cards_in_play_num)[suit_permutation_index(perm)]
+
+
+def probabilities_cache_info():
+    return canonical_probabilities.cache_info()
@@ -2,12 +2,29 @@ from flask import Flask, render_template, request, session
 from flask_socketio import SocketIO, emit, join_room, leave_room, close_room, rooms
 import logging
 
+import functools
+import itertools
+import os
+import random
+import uuid
+
+from dealer import Stream
+from eventlog import event_log
 from Game import Game
+from GameRegistry import GameRegistry
+from Matchmaker import Matchmaker
+from state import MemoryBackend, SQLiteBackend
+from outbox import outbox
+from logs import SampledLogger
+import metrics
 
 logging.getLogger("werkzeug").setLevel(logging.ERROR)
 
+log = SampledLogger("liars_poker.app")
+
 app = Flask(__name__)
-socketio = SocketIO(app)
+# Several workers share rooms through a message queue (e.g. redis://localhost:6379)
+socketio = SocketIO(app, message_queue = os.environ.get("SOCKETIO_MESSAGE_QUEUE"))
 
 
 @app.route("/")
@@ -15,84 +32,241 @@ def index():
     return render_template("index.html")
 
 
+@app.route("/metrics")
+def metrics_endpoint():
+    return metrics.render(), 200, {"Content-Type": metrics.CONTENT_TYPE}
+
+
 users = set()
 
-queue = []
+def get_backend():
+    if os.environ.get("GAME_STATE_BACKEND", "memory") == "sqlite":
+        return SQLiteBackend(os.environ.get("GAME_STATE_PATH", "game_state"))
+    return MemoryBackend()
+
+registry = GameRegistry(get_backend())
+
+# Room names are unique across workers, and across restarts of one worker,
+# whose rooms can still be live in a shared state backend
+WORKER_ID = os.environ.get("WORKER_ID") or uuid.uuid4().hex[:8]
+BOOT_ID = uuid.uuid4().hex[:6]
+game_index = itertools.count()
 
-game_index = 0
-games = {}
+# Every room deals from its own stream keyed by this seed and the room
+# name, so a room's deals can be replayed given the seed
+DEAL_SEED = int(os.environ.get("DEAL_SEED") or random.getrandbits(63))
+
+# Every game's moves are appended here; set GAME_EVENT_LOG to "" to turn it off
+EVENT_LOG_PATH = os.environ.get("GAME_EVENT_LOG", f"game_events.{WORKER_ID}.bin")
+EVENT_LOG_FLUSH_INTERVAL = 1
+
+IDLE_ROOM_TIMEOUT = 15 * 60  # seconds without a bet before a room is closed
+REAPER_INTERVAL = 30
+
+# Waiting players are per worker; tables are cut every MATCH_INTERVAL seconds.
+# Players are only matched with others connected to the same worker, so with
+# several workers the load balancer must route sessions to workers (sticky
+# sessions, which Socket.IO needs anyway), and a player can wait for a table
+# while another worker has someone queued.
+MATCH_INTERVAL = 0.25
+matchmaker = Matchmaker(
+    table_size = int(os.environ.get("TABLE_SIZE", 2)),
+    min_table_size = int(os.environ.get("MIN_TABLE_SIZE", 2)),
+    max_wait = float(os.environ.get("MATCH_MAX_WAIT", 10)),
+)
+
+HANDLER_SECONDS = metrics.Histogram("liars_poker_handler_seconds", "Socket.IO handler latency, including the outbox flush", ("handler",))
+GAMES_STARTED = metrics.Counter("liars_poker_games_started_total", "Games started by this worker")
+GAMES_FINISHED = metrics.Counter("liars_poker_games_finished_total", "Games finished by this worker", ("reason",))
+metrics.Gauge("liars_poker_queue_length", "Players waiting for a table on this worker", lambda: len(matchmaker))
+metrics.Gauge("liars_poker_active_rooms", "Live rooms in the state backend", lambda: len(registry))
 
 def get_room_name():
-    global game_index
-    room_name = f"Game #{game_index}"
-    game_index += 1
-    return room_name
+    return f"Game #{WORKER_ID}-{BOOT_ID}-{next(game_index)}"
+
+def flush_outbox():
+    outbox.flush(lambda event, data, to: socketio.emit(event, data, to = to))
+
+def flushes_outbox(handler):
+    # Everything a handler emits goes out as one batch per recipient when it returns.
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        try:
+            return handler(*args, **kwargs)
+        finally:
+            flush_outbox()
+    return wrapper
+
+def close_game(game: Game):
+    # Called after the registry has dropped the finished game, so players
+    # told it is over can queue again straight away
+    flush_outbox()
+    socketio.close_room(game.room)
+    GAMES_FINISHED.inc("won")
+
+def leave_game(game: Game, sids):
+    # Players knocked out or gone stop getting the room's messages, once
+    # they have been sent the ones about them
+    flush_outbox()
+    for sid in sids:
+        socketio.server.leave_room(sid, game.room, namespace = "/")
+
+def reap_idle_rooms():
+    while True:
+        socketio.sleep(REAPER_INTERVAL)
+        for room in registry.idle_rooms(IDLE_ROOM_TIMEOUT):
+            # Every worker reaps; only the one that deletes the room announces it
+            if not registry.close(room):
+                continue
+            log.info("reap", room = room)
+            GAMES_FINISHED.inc("idle")
+            socketio.emit("game_update", {'text': "Game closed after inactivity.", 'room': room}, to = room)
+            socketio.close_room(room)
+
+def flush_event_log():
+    while True:
+        socketio.sleep(EVENT_LOG_FLUSH_INTERVAL)
+        event_log.flush()
+
+def forfeit(sid: str):
+    with registry.remove_player(sid) as game:
+        if game is not None:
+            game.forfeit(sid)
+            if not game.game_finished and not game.deal_in_progess:
+                game.deal()
+
+    if game is not None:
+        if game.game_finished:
+            close_game(game)
+        else:
+            leave_game(game, [sid])
+
+def start_games(tables):
+    # Creates every matched room at once and sends their first deals together.
+    games = []
+    for sids in tables:
+        room = get_room_name()
+        log.info("room", room = room, sids = sids)
+        game = Game(sids = sids, room = room, rng = Stream.for_room(DEAL_SEED, room))
+        game.deal()
+        games.append(game)
+    try:
+        registry.add_many(games)
+        for game in games:
+            for sid in game.sids:
+                if sid in users:
+                    socketio.server.enter_room(sid, game.room, namespace = "/")
+    except Exception:
+        # Nobody has been told about these games yet, so they are dropped
+        outbox.flush(lambda event, data, to: None)
+        for game in games:
+            registry.close(game.room)
+            socketio.close_room(game.room)
+        raise
+    flush_outbox()
+    GAMES_STARTED.inc(amount = len(games))
+    # Players who disconnected after match() took them from the queue had
+    # no game to leave yet, so they leave it now
+    for sid in [sid for game in games for sid in game.player_sids if sid not in users]:
+        forfeit(sid)
+
+def requeue(tables):
+    # Players of tables that failed to start wait again, unless they are gone
+    # or their game did start
+    for sids in tables:
+        for sid in sids:
+            if sid in users and not registry.in_game(sid):
+                matchmaker.enqueue(sid)
+
+def match_players():
+    # An error fails one tick, never the loop
+    while True:
+        socketio.sleep(MATCH_INTERVAL)
+        tables = []
+        try:
+            tables = matchmaker.match()
+            if tables:
+                start_games(tables)
+                log.info("matched", tables = len(tables), **matchmaker.stats())
+        except Exception:
+            log.exception("match failed", tables = len(tables))
+            try:
+                requeue(tables)
+            except Exception:
+                log.exception("requeue failed", sids = [sid for sids in tables for sid in sids])
 
 @socketio.on("connect")
-def connect():
-    # print('connect', request.sid, request.__dict__.keys())
+@HANDLER_SECONDS.time("connect")
+@flushes_outbox
+def connect(auth = None):
     users.add(request.sid)
-    print("connect", request.sid[-4:])
-    emit("connected", {'sid': request.sid}, sid = request.sid)
-    # print(users)
+    log.info("connect", sid = request.sid)
+    outbox.add("connected", {'sid': request.sid}, to = request.sid)
 
 @socketio.on("play")
+@HANDLER_SECONDS.time("play")
+@flushes_outbox
 def play(data = None):
     
-    # TODO check if player is not in a game currently
-    
-    if request.sid not in queue:
-        queue.append(request.sid)
-        
-    print("play", request.sid[-4:], queue)
+    if registry.in_game(request.sid):
+        outbox.add("message", {'text': "youre already in a game"}, to = request.sid)
+        return
     
-    if len(queue) >= 2:
-        
-        sids = queue[:2]
-        
-        room = get_room_name()
+    if not matchmaker.enqueue(request.sid):
+        outbox.add("message", {'text': "youre already waiting for a game"}, to = request.sid)
+        return
         
-        print(f"Adding {sids} to room {room}")
-        for sid in sids:
-            join_room(room = room, sid = sid)
-            queue.remove(sid)
-            
-        game = Game(sids = sids, room = room)
-        game.deal()
-            
-        games[room] = game
+    log.info("play", sid = request.sid, queue = len(matchmaker))
 
 @socketio.on("bet")
+@HANDLER_SECONDS.time("bet")
+@flushes_outbox
 def bet(data):
-    print("bet", request.sid[-4:], data)
+    log.debug("bet", sid = request.sid, data = data)
     
-    game: Game = next(filter(lambda g: request.sid in g.sids, games.values()), None)
+    with registry.game_for(request.sid) as game:
     
-    if game is None:
-        emit("message", {'text': "youre not in game. join a game to make a bet"}, sid=request.sid)
-        return
-    
-    assert "bet" in data.keys()
-    
-    game.make_move(request.sid, data["bet"])
-                
+        if game is None:
+            outbox.add("message", {'text': "youre not in game. join a game to make a bet"}, to = request.sid)
+            return
+        
+        assert "bet" in data.keys()
+        
+        playing = game.player_sids
+        game.make_move(request.sid, data["bet"])
+        
+        if not game.game_finished and not game.deal_in_progess:
+            game.deal()
+
+    # Messages go out once the game is stored, for the same reason
     if game.game_finished:
-        close_room(game.room)
-        del games[game.room]
-    
-    if not game.deal_in_progess:
-        game.deal()
+        close_game(game)
+    else:
+        leave_game(game, set(playing) - set(game.player_sids))
 
 
 
 @socketio.on("disconnect")
-def disconnect():
-    users.remove(request.sid)
-    if request.sid in queue:
-        queue.remove(request.sid)
-    # TODO remove from games
-    print("disconnect", request.sid[-4:])
+@HANDLER_SECONDS.time("disconnect")
+@flushes_outbox
+def disconnect(reason = None):
+    users.discard(request.sid)
+    matchmaker.cancel(request.sid)
+    forfeit(request.sid)
+    log.info("disconnect", sid = request.sid)
+
+
+def run(host = "0.0.0.0", port = 5000, **kwargs):
+    # Starts the background tasks and serves; kwargs go to socketio.run
+    if EVENT_LOG_PATH:
+        event_log.open(EVENT_LOG_PATH)
+        socketio.start_background_task(flush_event_log)
+    socketio.start_background_task(reap_idle_rooms)
+    socketio.start_background_task(match_players)
+    socketio.run(app = app, host = host, port = port, **kwargs)
 
 
 if __name__ == "__main__":
-    socketio.run(app = app, host='0.0.0.0', port=5000)
+    logging.basicConfig(level = os.environ.get("LOG_LEVEL", "WARNING"))
+    log.info("deal seed", seed = DEAL_SEED, worker = WORKER_ID)
+    run(port = int(os.environ.get("PORT", 5000)))
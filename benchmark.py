@@ -0,0 +1,380 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from typing import Callable, Dict
+
+import numpy as np
+
+from Advisor import get_advisor
+from bots import RandomBot, self_play
+from eventlog import Replay, event_log, read
+from dealer import deal_tables
+from Deck import Deck
+from Game import Game
+from GameRegistry import GameRegistry
+from Hand import Hand
+from Inference import Inference
+from loadtest import run_stage
+from Solver import Solver
+from registry import BY_NAME, COMBINATIONS
+from outbox import outbox
+from state import SQLiteBackend
+import simulate
+
+RESULTS_FILENAME = 'benchmark_results.json'
+BASELINE_FILENAME = 'benchmark_baseline.json'
+
+CARDS_IN_PLAY_N_LIST = list(range(2, 25))
+
+# With N workers, each must keep at least this share of the 1-worker rate
+SCALING_MIN_EFFICIENCY = 0.7
+
+# The server never needs these; importing one on the way to app is a regression
+HEAVY_MODULES = ("numpy", "pandas", "tqdm", "Solver", "simulate")
+# Cold `import app` on the lean path measures about 350-450 ms
+IMPORT_BUDGET_MS = 600
+
+
+def measure(func: Callable, repeat: int = 5) -> float:
+    # Best seconds per call over repeat runs of an auto-sized loop.
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat = repeat, number = number)) / number
+
+
+class HeadlessGame(Game):
+    def emit(self, event, data = {}, to = None):
+        pass
+
+
+def bench_deck_init():
+    return measure(lambda: Deck())
+
+
+def bench_deck_get_hands():
+    random.seed(0)
+    return measure(lambda: Deck().get_hands([3, 3, 2]))
+
+
+def bench_deal_tables(rooms: int = 10_000, players: int = 4):
+    rng = np.random.default_rng(0)
+    keys = rng.integers(0, 2 ** 63, rooms, dtype=np.int64).astype(np.uint64)
+    counters = np.zeros(rooms, dtype=np.uint64)
+    hand_counts = np.full((rooms, players), 2)
+    return measure(lambda: deal_tables(keys, counters, hand_counts))
+
+
+def solver_hand(n: int):
+    return random.Random(n).sample(Deck.get_all_cards(), min(n, 3))
+
+
+def bench_solver_method(method: str):
+    calls = [
+        (Solver(solver_hand(n), n), combination.kwargs)
+        for n in CARDS_IN_PLAY_N_LIST
+        for combination in COMBINATIONS if combination.probability == method
+    ]
+
+    def run():
+        for solver, kwargs in calls:
+            getattr(solver, method)(**kwargs)
+
+    return measure(run)
+
+
+def bench_solver_full_pass():
+    solvers = [Solver(solver_hand(n), n) for n in CARDS_IN_PLAY_N_LIST]
+
+    def run():
+        for solver in solvers:
+            solver.compute_probabilities()
+
+    return measure(run)
+
+
+def bench_simulate_samples_per_second(size: int = 20_000):
+    rng = np.random.default_rng(0)
+    seconds = measure(lambda: simulate.sample_counts(rng, simulate.cards_in_play_n_list, size), repeat = 3)
+    return size * len(simulate.cards_in_play_n_list) / seconds
+
+
+def bench_game_round_trip():
+    random.seed(0)
+
+    def run():
+        game = HeadlessGame(sids = ["A", "B", "C"], room = "benchmark")
+        game.deal()
+        game.make_move("A", "high_card_9")
+        game.make_move("B", "check")
+
+    return measure(run)
+
+
+def bench_advisor_query():
+    advisors = [get_advisor(Hand.from_cards(solver_hand(n)).mask, n) for n in CARDS_IN_PLAY_N_LIST]
+
+    def run():
+        for advisor in advisors:
+            advisor.ranked_bets(20)
+            advisor.best_bet(20)
+            advisor.check_wins(20)
+
+    return measure(run) / len(advisors)
+
+
+def bench_inference(method: str, players: int = 6):
+    # At a full table: "observe" is one bet update, "probabilities" the
+    # posterior vector
+    inference = Inference(solver_hand(3), {str(i): 3 for i in range(players - 1)}, seed = 0)
+    if method == "observe":
+        return measure(lambda: inference.observe("0", 20))
+    return measure(inference.probabilities, repeat = 3)
+
+
+def bench_self_play_games_per_second(games: int = 2_000):
+    rng = random.Random(0)
+    bots = [RandomBot(rng), RandomBot(rng)]
+    seconds = measure(lambda: self_play(bots, games, rng), repeat = 3)
+    return games / seconds
+
+
+def bench_replay_events_per_second(games: int = 2_000):
+    # Replays an event log of self-play games through the rules
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "events.bin")
+        event_log.open(path)
+        try:
+            self_play([RandomBot(rng), RandomBot(rng), RandomBot(rng)], games, rng)
+        finally:
+            event_log.close()
+        events = sum(1 for _ in read(path))
+        return events / measure(lambda: Replay().run([path]), repeat = 3)
+
+
+def scaling_worker(path: str, worker: int, seconds: float) -> int:
+    # Plays random games through the shared SQLite state until time is up and
+    # returns how many moves were made. Every move is a load / save round trip.
+    rng = random.Random(worker)
+    registry = GameRegistry(SQLiteBackend(path))
+    moves = 0
+    deadline = time.monotonic() + seconds
+    for index in itertools.count():
+        if time.monotonic() >= deadline:
+            return moves
+        room = f"benchmark-{worker}-{index}"
+        game = Game(sids = [f"{room}-{player}" for player in range(3)], room = room)
+        game.deal()
+        registry.add(game)
+        finished = False
+        while not finished and time.monotonic() < deadline:
+            with registry.game(room) as game:
+                sid = game.players[game.player_turn_index].sid
+                last = -1 if game.last_bet is None else BY_NAME[game.last_bet].id
+                if last >= 0 and (rng.random() < 0.5 or last + 1 == len(COMBINATIONS)):
+                    game.make_move(sid, "check")
+                else:
+                    game.make_move(sid, COMBINATIONS[rng.randint(last + 1, min(last + 3, len(COMBINATIONS) - 1))].name)
+                if not game.game_finished and not game.deal_in_progess:
+                    game.deal()
+                finished = game.game_finished
+            outbox.flush(lambda event, data, to: None)
+            moves += 1
+
+
+def bench_scaling(max_workers: int, seconds: float = 5) -> Dict[str, dict]:
+    # Moves per second with 1..max_workers processes sharing one state store.
+    # Ideal scaling keeps per_worker flat; it can only hold up to the number
+    # of cores.
+    results = {}
+    for workers in range(1, max_workers + 1):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "game_state")
+            SQLiteBackend(path)  # create the schema before the workers race for it
+            with multiprocessing.Pool(workers) as pool:
+                moves = sum(pool.starmap(scaling_worker, [(path, worker, seconds) for worker in range(workers)]))
+        per_second = moves / seconds
+        results[f"scaling_{workers}_workers"] = {"per_second": per_second, "per_worker": per_second / workers}
+    return results
+
+
+def start_server(port: int, path: str, worker: int) -> subprocess.Popen:
+    # One app worker on the shared SQLite state, ready once it accepts connections
+    env = dict(os.environ, GAME_STATE_BACKEND = "sqlite", GAME_STATE_PATH = path, WORKER_ID = f"bench{worker}", GAME_EVENT_LOG = "")
+    process = subprocess.Popen(
+        [sys.executable, "-c", f"import app; app.run('127.0.0.1', {port}, allow_unsafe_werkzeug = True)"],
+        cwd = os.path.dirname(os.path.abspath(__file__)), env = env,
+        stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout = 1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"app worker on port {port} did not start")
+
+
+def server_scaling_clients(url: str, clients: int, games: int, seed: int) -> dict:
+    return run_stage(url, clients, games, "random", rate = 200, timeout = 300, seed = seed)
+
+
+def bench_server_scaling(max_workers: int, clients: int = 20, games: int = 5, port: int = 5100) -> Dict[str, dict]:
+    # Bets per second through 1..max_workers app workers sharing SQLite
+    # state, each driven by its own process of Socket.IO clients. Clients
+    # stay on one worker, since matchmaking is per worker.
+    results = {}
+    for workers in range(1, max_workers + 1):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "game_state")
+            SQLiteBackend(path)
+            servers = [start_server(port + worker, path, worker) for worker in range(workers)]
+            try:
+                with multiprocessing.Pool(workers) as pool:
+                    stages = pool.starmap(server_scaling_clients, [(f"http://127.0.0.1:{port + worker}", clients, games, worker) for worker in range(workers)])
+            finally:
+                for server in servers:
+                    server.terminate()
+                    server.wait()
+        assert not any(stage["errors"] for stage in stages), "load test clients reported errors"
+        per_second = sum(stage["bets"] for stage in stages) / max(stage["seconds"] for stage in stages)
+        results[f"server_scaling_{workers}_workers"] = {"per_second": per_second, "per_worker": per_second / workers}
+    return results
+
+
+def check_scaling(results: Dict[str, dict], min_efficiency: float = SCALING_MIN_EFFICIENCY) -> int:
+    # Prints per-worker throughput against 1 worker and returns how many
+    # worker counts fall below min_efficiency of it.
+    failures = 0
+    for prefix in ("scaling", "server_scaling"):
+        single = results.get(f"{prefix}_1_workers")
+        if single is None:
+            continue
+        for workers in itertools.count(1):
+            result = results.get(f"{prefix}_{workers}_workers")
+            if result is None:
+                break
+            efficiency = result["per_worker"] / single["per_worker"]
+            failed = efficiency < min_efficiency
+            failures += failed
+            print(f"{prefix:15} {workers:3} workers  {result['per_second']:10.1f}/s  {efficiency:5.2f} of 1 worker{'  TOO SLOW' if failed else ''}")
+    return failures
+
+
+def import_time(module: str, repeat: int = 5) -> Dict[str, object]:
+    # Cold import in a fresh interpreter, from python -X importtime: best
+    # cumulative milliseconds over repeat runs, plus heavy modules it pulled in.
+    best = float("inf")
+    for _ in range(repeat):
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output = True, text = True, check = True,
+        )
+        loaded = set()
+        for line in process.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                loaded.add(name.strip())
+                if name.strip() == module:
+                    best = min(best, int(cumulative) / 1000)
+    return {"seconds": best / 1000, "milliseconds": best, "heavy": sorted(loaded.intersection(HEAVY_MODULES))}
+
+
+def check_import(result: Dict[str, object], budget_ms: float = IMPORT_BUDGET_MS) -> int:
+    # 1 when the import_app result is over budget or loaded a heavy module
+    failed = result["milliseconds"] > budget_ms or bool(result["heavy"])
+    print(f"import app {result['milliseconds']:.0f} ms (budget {budget_ms:.0f} ms), heavy modules: {result['heavy'] or 'none'}{'  OVER BUDGET' if failed else ''}")
+    return int(failed)
+
+
+def run_benchmarks() -> Dict[str, dict]:
+    results = {
+        "deck_init": {"seconds": bench_deck_init()},
+        "deck_get_hands": {"seconds": bench_deck_get_hands()},
+        "deal_10k_tables": {"seconds": bench_deal_tables()},
+    }
+    for method in dict.fromkeys(combination.probability for combination in COMBINATIONS):
+        results[f"solver_{method}"] = {"seconds": bench_solver_method(method)}
+    results["solver_full_pass"] = {"seconds": bench_solver_full_pass()}
+    results["simulate_samples"] = {"per_second": bench_simulate_samples_per_second()}
+    results["game_round_trip"] = {"seconds": bench_game_round_trip()}
+    results["advisor_query"] = {"seconds": bench_advisor_query()}
+    for method in ("observe", "probabilities"):
+        results[f"inference_{method}"] = {"seconds": bench_inference(method)}
+    results["self_play_games"] = {"per_second": bench_self_play_games_per_second()}
+    results["replay_events"] = {"per_second": bench_replay_events_per_second()}
+    results["import_app"] = import_time("app")
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> int:
+    # Prints new / baseline for every benchmark, where > 1 is slower, and
+    # returns how many are slower than tolerance allows.
+    regressions = 0
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:40} (no baseline)")
+            continue
+        if "seconds" in result:
+            ratio = result["seconds"] / baseline[name]["seconds"]
+        else:
+            ratio = baseline[name]["per_second"] / result["per_second"]
+        regressed = ratio > tolerance
+        regressions += regressed
+        print(f"{name:40} {ratio:6.2f}x{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the hot paths and compare them against a stored baseline.")
+    parser.add_argument("--output", default=RESULTS_FILENAME)
+    parser.add_argument("--baseline", default=BASELINE_FILENAME)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="slowdown ratio reported as a regression")
+    parser.add_argument("--scaling", type=int, nargs="?", default=0, const=os.cpu_count(), metavar="N", help="also check that throughput scales over 1..N (default: CPU count) in-process and app workers sharing SQLite state")
+    parser.add_argument("--scaling-efficiency", type=float, default=SCALING_MIN_EFFICIENCY, help="per-worker share of the 1-worker rate --scaling requires")
+    parser.add_argument("--import-budget-ms", type=float, default=IMPORT_BUDGET_MS, help="fail when a cold import of app takes longer than this or loads a heavy module")
+    parser.add_argument("--import-only", action="store_true", help="only run the import check")
+    args = parser.parse_args()
+
+    if args.import_only:
+        exit(check_import(import_time("app"), args.import_budget_ms))
+
+    results = run_benchmarks()
+    failures = check_import(results["import_app"], args.import_budget_ms)
+    if args.scaling:
+        results.update(bench_scaling(args.scaling))
+        results.update(bench_server_scaling(args.scaling))
+        failures += check_scaling(results, args.scaling_efficiency)
+    report = {"python": platform.python_version(), "machine": platform.machine(), "results": results}
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        failures += compare(results, baseline, args.tolerance)
+    else:
+        for name, result in results.items():
+            print(f"{name:40} {result}")
+
+    exit(1 if failures else 0)
@@ -0,0 +1,103 @@
+import argparse
+import random
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from Engine import Engine
+from eventlog import event_log
+import metrics
+from registry import COMBINATIONS
+from Solver import hand_probabilities
+
+# A bot plays for the player whose turn it is: a bet id, or None to check.
+Bot = Callable[[Engine], Optional[int]]
+
+
+class RandomBot:
+    def __init__(self, rng = random, check_rate: float = 0.5, max_raise: int = 3):
+        self.rng = rng
+        self.check_rate = check_rate
+        self.max_raise = max_raise
+
+    def __call__(self, engine: Engine) -> Optional[int]:
+        last = engine.last_bet
+        if last is not None and (last + 1 == len(COMBINATIONS) or self.rng.random() < self.check_rate):
+            return None
+        low = 0 if last is None else last + 1
+        return low + int(self.rng.random() * (min(low + self.max_raise, len(COMBINATIONS)) - low))
+
+
+class SolverBot:
+    # Checks when the last bet is less likely than threshold given its own
+    # hand, otherwise raises to the lowest bet that is at least that likely.
+
+    def __init__(self, threshold: float = 0.5):
+        self.threshold = threshold
+
+    def __call__(self, engine: Engine) -> Optional[int]:
+        probabilities = hand_probabilities(engine.hands[engine.turn], engine.cards_in_play())
+        last = engine.last_bet
+        if last is not None and probabilities[last] < self.threshold:
+            return None
+        low = 0 if last is None else last + 1
+        likely = np.flatnonzero(probabilities[low:] >= self.threshold)
+        if len(likely):
+            return low + int(likely[0])
+        return 0 if last is None else None
+
+
+BOTS = {"random": RandomBot, "solver": SolverBot}
+
+
+def play(engine: Engine, bots: Dict[str, Bot], room: str = None) -> str:
+    # Runs the game to the end and returns the winner's sid. Games with a
+    # room go to the event log, when it is open.
+    record = event_log.record if room is not None and event_log.enabled else lambda room, engine, events: None
+    record(room, engine, engine.start())
+    while not engine.finished:
+        if not engine.deal_in_progress:
+            record(room, engine, engine.deal())
+        sid = engine.players[engine.turn]
+        bet = bots[sid](engine)
+        events = engine.check(sid) if bet is None else engine.bet(sid, bet)
+        assert events[0].kind in ("bet", "check"), events
+        record(room, engine, events)
+    return engine.players[0]
+
+
+def self_play(bots: List[Bot], games: int, rng = random) -> Counter:
+    # Wins per seat over games played in-process.
+    sids = [str(seat) for seat in range(len(bots))]
+    by_sid = dict(zip(sids, bots))
+    return Counter(play(Engine(sids, rng), by_sid, f"self-play-{game}") for game in range(games))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play bots against each other without a server.")
+    parser.add_argument("--games", type=int, default=10_000)
+    parser.add_argument("--bots", nargs="+", choices=BOTS, default=["random", "random"], help="one bot per seat, 2 to 6")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--event-log", default=None, metavar="PATH", help="append every game to this event log")
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve Prometheus metrics, including Solver timings, on this port")
+    args = parser.parse_args()
+
+    if args.metrics_port is not None:
+        metrics.serve(args.metrics_port)
+
+    if args.event_log is not None:
+        event_log.open(args.event_log)
+
+    assert 2 <= len(args.bots) <= 6
+    rng = random.Random(args.seed)
+    bots = [RandomBot(rng) if name == "random" else BOTS[name]() for name in args.bots]
+
+    start = time.perf_counter()
+    wins = self_play(bots, args.games, rng)
+    seconds = time.perf_counter() - start
+
+    print(f"{args.games} games in {seconds:.2f}s ({args.games / seconds:,.0f} games/s)")
+    for seat, name in enumerate(args.bots):
+        print(f"seat {seat} {name:8} {wins[str(seat)] / args.games:.3f}")
@@ -0,0 +1,37 @@
+from fractions import Fraction
+from typing import List, Union
+
+from helpers import binomial
+
+
+def convolve(a: List[int], b: List[int]) -> List[int]:
+    result = [0] * (len(a) + len(b) - 1)
+    for i, x in enumerate(a):
+        if x:
+            for j, y in enumerate(b):
+                result[i + j] += x * y
+    return result
+
+
+def ways_at_least(needs: List[int], available: List[int], others: int, n: int) -> int:
+    # Ways to draw n cards so that group i contributes at least needs[i] of its
+    # available[i] cards; the remaining "others" cards are unrestricted.
+    # Multiplies the generating functions sum_{k >= need} C(available, k) x^k
+    # and reads off the coefficients against C(others, n - k).
+    ways_by_cards = [1]
+    for need, count in zip(needs, available):
+        ways_by_cards = convolve(ways_by_cards, [0] * need + [binomial(count, k) for k in range(need, count + 1)])
+
+    return sum(
+        ways * binomial(others, n - cards)
+        for cards, ways in enumerate(ways_by_cards)
+        if cards <= n and n - cards <= others
+    )
+
+
+def probability_at_least(needs: List[int], available: List[int], others: int, n: int, exact: bool = False) -> Union[float, Fraction]:
+    ways_total = binomial(sum(available) + others, n)
+    ways_positive = ways_at_least(needs, available, others, n)
+    if exact:
+        return Fraction(ways_positive, ways_total)
+    return ways_positive / ways_total
@@ -0,0 +1,165 @@
+import argparse
+import json
+import os
+import pickle
+import random
+import struct
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+import registry
+
+# A counts file is a fixed header followed by samples[rows] and
+# counts[rows, columns] as little-endian int64. Next to it, <file>.json
+# says what the rows and columns are:
+# {"version", "cards_in_play": [n of each row], "combinations": [[id, name] of each column], "samples": [per row]}
+# Readers map the arrays straight out of the file read-only, so every UI
+# and server process opening the same file shares one copy in the page cache.
+
+HEADER = struct.Struct('<8sIIIqq')  # magic, version, rows, columns, seed, batches
+MAGIC = b'LPCOUNTS'
+VERSION = 2
+# Version 1 put the arrays right after the 36 byte header; version 2 pads
+# the header to 64 bytes so they are aligned.
+DATA_OFFSET = {1: HEADER.size, 2: 64}
+
+DEFAULT_CARDS_IN_PLAY = list(range(2, 19))  # simulate.cards_in_play_n_list, for files without a schema
+
+
+def schema_filename(filename: str) -> str:
+    return f"{filename}.json"
+
+
+def wilson_interval(hits: np.ndarray, samples: np.ndarray, z: float = 1.96):
+    samples = np.maximum(samples, 1)
+    p = hits / samples
+    denominator = 1 + z ** 2 / samples
+    center = (p + z ** 2 / (2 * samples)) / denominator
+    half_width = z * np.sqrt(p * (1 - p) / samples + z ** 2 / (4 * samples ** 2)) / denominator
+    return center - half_width, center + half_width
+
+
+def replace_file(filename: str, data: bytes):
+    # Write next to the file and rename over it, so a reader or a crash
+    # never sees a half-written file.
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+
+def write(
+    filename: str,
+    seed: int,
+    batches: int,
+    cards_in_play: Sequence[int],
+    names: Sequence[str],
+    samples: np.ndarray,
+    counts: np.ndarray,
+):
+    assert counts.shape == (len(cards_in_play), len(names)) and samples.shape == (len(cards_in_play),)
+    schema = {
+        "version": VERSION,
+        "cards_in_play": [int(n) for n in cards_in_play],
+        "combinations": [[registry.BY_NAME[name].id, name] for name in names],
+        "samples": samples.tolist(),
+    }
+    header = HEADER.pack(MAGIC, VERSION, *counts.shape, seed, batches).ljust(DATA_OFFSET[VERSION], b'\0')
+    # The schema goes first: readers check it against the header, and the
+    # shape never changes between checkpoints of one run.
+    replace_file(schema_filename(filename), json.dumps(schema).encode())
+    replace_file(filename, header + samples.astype('<i8').tobytes() + counts.astype('<i8').tobytes())
+
+
+class Estimate(NamedTuple):
+    # All (rows, columns) arrays for the queried slice
+    probability: np.ndarray
+    low: np.ndarray
+    high: np.ndarray
+    samples: np.ndarray
+
+
+class Counts:
+    # Combination hit counts by cards in play, with per-row sample totals.
+    # Built by open_counts (memory-mapped) or from_pickle (in memory).
+
+    def __init__(self, cards_in_play: Sequence[int], names: Sequence[str], samples: np.ndarray, counts: np.ndarray, seed: int = 0, batches: int = 0):
+        self.cards_in_play = list(cards_in_play)
+        self.names = list(names)
+        self.samples = samples
+        self.counts = counts
+        self.seed = seed
+        self.batches = batches
+        self.row: Dict[int, int] = {n: i for i, n in enumerate(self.cards_in_play)}
+        self.column: Dict[str, int] = {name: i for i, name in enumerate(self.names)}
+
+    def query(self, cards_in_play: Optional[Sequence[int]] = None, names: Optional[Sequence[str]] = None, z: float = 1.96) -> Estimate:
+        # Probabilities and Wilson intervals for the given rows and columns
+        # (all of them by default). Only the slice is read from the file.
+        rows = list(range(len(self.cards_in_play))) if cards_in_play is None else [self.row[n] for n in cards_in_play]
+        columns = list(range(len(self.names))) if names is None else [self.column[name] for name in names]
+        samples = np.asarray(self.samples[rows])[:, None]
+        hits = np.asarray(self.counts[np.ix_(rows, columns)])
+        low, high = wilson_interval(hits, samples, z)
+        return Estimate(hits / np.maximum(samples, 1), low, high, np.broadcast_to(samples, hits.shape))
+
+    def save(self, filename: str):
+        write(filename, self.seed, self.batches, self.cards_in_play, self.names, np.asarray(self.samples), np.asarray(self.counts))
+
+
+def open_counts(filename: str) -> Counts:
+    with open(filename, 'rb') as f:
+        magic, version, rows, columns, seed, batches = HEADER.unpack(f.read(HEADER.size))
+    assert magic == MAGIC, f"{filename} is not a simulation counts file"
+    assert version in DATA_OFFSET, f"Unsupported counts file version {version}"
+    offset = DATA_OFFSET[version]
+    assert os.path.getsize(filename) == offset + (rows + rows * columns) * 8, f"{filename} is truncated"
+
+    if os.path.exists(schema_filename(filename)):
+        with open(schema_filename(filename)) as f:
+            schema = json.load(f)
+        cards_in_play = schema["cards_in_play"]
+        names = [name for _, name in schema["combinations"]]
+    else:
+        # Version 1 checkpoints were written without a schema
+        cards_in_play, names = DEFAULT_CARDS_IN_PLAY, registry.NAMES
+    assert (rows, columns) == (len(cards_in_play), len(names)), f"{filename} does not match its schema"
+
+    samples = np.memmap(filename, dtype='<i8', mode='r', offset=offset, shape=(rows,))
+    counts = np.memmap(filename, dtype='<i8', mode='r', offset=offset + rows * 8, shape=(rows, columns))
+    return Counts(cards_in_play, names, samples, counts, seed, batches)
+
+
+def from_pickle(filename: str) -> Counts:
+    # The legacy simulation_counts.pickle: a DataFrame indexed by cards in
+    # play with one 'is_<combination>' column per combination and the
+    # samples per row in attrs["n"].
+    with open(filename, 'rb') as f:
+        df = pickle.load(f)
+    df = df.rename(columns = lambda name: name[len("is_"):] if name.startswith("is_") else name)
+    counts = df[registry.NAMES].to_numpy(dtype=np.int64)
+    samples = np.full(len(df.index), df.attrs["n"], dtype=np.int64)
+    # A fresh seed, so resuming a converted file does not replay the streams
+    # of some other run
+    return Counts(list(df.index), registry.NAMES, samples, counts, random.getrandbits(63))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert or query simulation counts.")
+    parser.add_argument("filename", help="counts file to query, or to write with --from-pickle")
+    parser.add_argument("--from-pickle", default=None, metavar="PICKLE", help="convert a legacy counts pickle into filename")
+    parser.add_argument("--cards-in-play", type=int, nargs="*", default=None)
+    parser.add_argument("--combinations", nargs="*", default=None)
+    args = parser.parse_args()
+
+    if args.from_pickle is not None:
+        from_pickle(args.from_pickle).save(args.filename)
+
+    counts = open_counts(args.filename)
+    estimate = counts.query(args.cards_in_play, args.combinations)
+    for i, n in enumerate(counts.cards_in_play if args.cards_in_play is None else args.cards_in_play):
+        for j, name in enumerate(counts.names if args.combinations is None else args.combinations):
+            print(f"{n:3} {name:20} {estimate.probability[i, j]:.5f}  [{estimate.low[i, j]:.5f}, {estimate.high[i, j]:.5f}]  n={estimate.samples[i, j]}")
@@ -0,0 +1,106 @@
+import hashlib
+from typing import List, Sequence
+
+from helpers import TOTAL_CARDS_NUM
+
+# Counter-based dealing: deal number `counter` of a stream `key` is a pure
+# function of the two. Every card gets a 64-bit splitmix64 key and the
+# deal is the cards in key order (splitmix64 is a bijection and the cards'
+# inputs differ, so keys never tie and any sort agrees). A room's deals can
+# be replayed from its key and any number of rooms dealt at once with NumPy.
+# Stream is plain Python, so the server can deal without importing numpy;
+# deal_tables gives exactly the same cards.
+
+MASK64 = (1 << 64) - 1
+GAMMA = 0x9E3779B97F4A7C15
+MIX_A = 0xBF58476D1CE4E5B9
+MIX_B = 0x94D049BB133111EB
+
+
+def splitmix64(x: int) -> int:
+    x = (x + GAMMA) & MASK64
+    x = ((x ^ (x >> 30)) * MIX_A) & MASK64
+    x = ((x ^ (x >> 27)) * MIX_B) & MASK64
+    return x ^ (x >> 31)
+
+
+def permutation(key: int, counter: int, n: int = TOTAL_CARDS_NUM) -> List[int]:
+    base = splitmix64(key ^ splitmix64(counter))
+    keys = [splitmix64((base + i * GAMMA) & MASK64) for i in range(n)]
+    return sorted(range(n), key = keys.__getitem__)
+
+
+class Stream:
+    # One room's deals. Has random.sample's signature, so it can be passed
+    # as the rng of an Engine, Game or Deck.get_hands.
+
+    __slots__ = ("key", "counter")
+
+    def __init__(self, key: int, counter: int = 0):
+        self.key = key & MASK64
+        self.counter = counter
+
+    @classmethod
+    def for_room(cls, seed: int, room: str) -> "Stream":
+        # Rooms of one seed get unrelated keys
+        digest = hashlib.blake2b(room.encode(), digest_size = 8, key = (seed & MASK64).to_bytes(8, "little")).digest()
+        return cls(int.from_bytes(digest, "little"))
+
+    def sample(self, population: Sequence, k: int) -> list:
+        order = permutation(self.key, self.counter, len(population))
+        self.counter += 1
+        return [population[i] for i in order[:k]]
+
+    def to_state(self) -> list:
+        return [self.key, self.counter]
+
+    def __repr__(self):
+        return f"Stream(key={self.key:#018x}, counter={self.counter})"
+
+
+def permutations(keys: "np.ndarray", counters: "np.ndarray", n: int = TOTAL_CARDS_NUM) -> "np.ndarray":
+    # (R,) keys and counters -> (R, n) card orders, row r equal to
+    # permutation(keys[r], counters[r], n)
+    import numpy as np
+
+    def mix(x):
+        x = x + np.uint64(GAMMA)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(MIX_A)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(MIX_B)
+        return x ^ (x >> np.uint64(31))
+
+    keys = np.asarray(keys, dtype=np.uint64)
+    counters = np.asarray(counters, dtype=np.uint64)
+    base = mix(keys ^ mix(counters))
+    card_keys = mix(base[:, None] + np.arange(n, dtype=np.uint64) * np.uint64(GAMMA))
+    return np.argsort(card_keys, axis = 1).astype(np.int8)
+
+
+def deal_tables(keys: "np.ndarray", counters: "np.ndarray", hand_counts: "np.ndarray") -> "np.ndarray":
+    # (R,) keys and counters, (R, P) cards per seat (0 for an empty seat)
+    # -> (R, P) int64 hand masks. Seats take consecutive cards of the
+    # table's order, like Engine.deal.
+    import numpy as np
+
+    hand_counts = np.asarray(hand_counts, dtype=np.int64)
+    ends = np.cumsum(hand_counts, axis = 1)
+    assert (ends[:, -1] <= TOTAL_CARDS_NUM).all(), "Not enough cards in deck!"
+    # Cards are distinct bits, so a seat's mask is a difference of running sums
+    bits = np.left_shift(np.int64(1), permutations(keys, counters).astype(np.int64))
+    running = np.zeros((len(bits), TOTAL_CARDS_NUM + 1), dtype=np.int64)
+    np.cumsum(bits, axis = 1, out = running[:, 1:])
+    return np.take_along_axis(running, ends, axis = 1) - np.take_along_axis(running, ends - hand_counts, axis = 1)
+
+
+def deal_streams(streams: List[Stream], hand_counts: List[List[int]]) -> List[List[int]]:
+    # The next deal of every stream at once, advancing each by one
+    import numpy as np
+
+    seats = max(len(counts) for counts in hand_counts)
+    padded = np.zeros((len(streams), seats), dtype=np.int64)
+    for row, counts in enumerate(hand_counts):
+        padded[row, :len(counts)] = counts
+    masks = deal_tables([stream.key for stream in streams], [stream.counter for stream in streams], padded)
+    for stream in streams:
+        stream.counter += 1
+    return [row[:len(counts)] for row, counts in zip(masks.tolist(), hand_counts)]
@@ -0,0 +1,289 @@
+import argparse
+import atexit
+import csv
+import hashlib
+import heapq
+import struct
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Iterator, List, Tuple
+
+from dealer import Stream
+from Engine import Engine, Event
+from registry import COMBINATIONS
+
+# An append-only binary log of every game's moves. The file starts with
+# FILE_HEADER; then each record is PREFIX (kind, game id, unix time)
+# followed by its kind's fields. Seats are indices into the game's sids.
+#   START  room and sids, as length-prefixed UTF-8
+#   DEAL   stream key and counter (0, 0 when the room has no Stream), seat
+#          count, then one uint32 hand mask per player still in, in turn order
+#   BET    seat, combination id
+#   CHECK  checker seat, loser seat (the checker loses when the bet held)
+#   OUT    seat knocked out
+#   WON    winning seat
+#   LEFT   seat that left the game
+
+FILE_HEADER = struct.Struct('<8sI')
+MAGIC = b'LPEVENTS'
+VERSION = 1
+
+PREFIX = struct.Struct('<BQd')
+START, DEAL, BET, CHECK, OUT, WON, LEFT = range(7)
+KIND_NAMES = ("start", "deal", "bet", "check", "out", "won", "left")
+
+DEAL_FIELDS = struct.Struct('<QIB')
+TWO_BYTES = struct.Struct('<BB')
+ONE_BYTE = struct.Struct('<B')
+HAND = struct.Struct('<I')
+
+
+@lru_cache(maxsize = 4096)
+def game_id(room: str) -> int:
+    # Stable across workers, so logs of one room from several workers merge
+    return int.from_bytes(hashlib.blake2b(room.encode(), digest_size = 8).digest(), "little")
+
+
+def pack_strings(strings: List[str]) -> bytes:
+    encoded = [string.encode() for string in strings]
+    return bytes([len(encoded)]) + b"".join(bytes([len(string)]) + string for string in encoded)
+
+
+class EventLog:
+    # Engine events are packed as they happen and kept in memory; the
+    # buffer is written out once it holds flush_bytes, on flush() and when
+    # the process exits. Does nothing until open() is called.
+
+    def __init__(self, flush_bytes: int = 1 << 16):
+        self.flush_bytes = flush_bytes
+        self.lock = threading.Lock()
+        self.buffer = bytearray()
+        self.file = None
+
+    def open(self, path: str):
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        atexit.register(self.close)
+
+    @property
+    def enabled(self) -> bool:
+        return self.file is not None
+
+    def record(self, room: str, engine: Engine, events: List[Event]):
+        if self.file is None:
+            return
+        game = game_id(room)
+        now = time.time()
+        records = []
+        checker = None
+        dealt = False
+        for event in events:
+            kind = event.kind
+            if kind == "start":
+                records.append(PREFIX.pack(START, game, now) + pack_strings([room, *engine.sids]))
+            elif kind == "deal":
+                # One record for the whole deal
+                if dealt:
+                    continue
+                dealt = True
+                key, counter = (engine.rng.key, engine.rng.counter - 1) if isinstance(engine.rng, Stream) else (0, 0)
+                hands = b"".join(HAND.pack(hand) for hand in engine.hands)
+                records.append(PREFIX.pack(DEAL, game, now) + DEAL_FIELDS.pack(key, counter, len(engine.hands)) + hands)
+            elif kind == "bet":
+                records.append(PREFIX.pack(BET, game, now) + TWO_BYTES.pack(engine.sids.index(event.sid), event.value))
+            elif kind == "check":
+                checker = engine.sids.index(event.sid)
+            elif kind == "lost" and checker is not None:
+                records.append(PREFIX.pack(CHECK, game, now) + TWO_BYTES.pack(checker, engine.sids.index(event.sid)))
+            elif kind in ("out", "won", "left"):
+                records.append(PREFIX.pack(KIND_NAMES.index(kind), game, now) + ONE_BYTE.pack(engine.sids.index(event.sid)))
+        if not records:
+            return
+        with self.lock:
+            self.buffer += b"".join(records)
+            if len(self.buffer) >= self.flush_bytes:
+                self.write()
+
+    def write(self):
+        self.file.write(self.buffer)
+        self.file.flush()
+        self.buffer.clear()
+
+    def flush(self):
+        if self.file is None:
+            return
+        with self.lock:
+            self.write()
+
+    def close(self):
+        if self.file is None:
+            return
+        self.flush()
+        self.file.close()
+        self.file = None
+
+
+event_log = EventLog()
+
+
+# READING AND REPLAY
+
+Record = Tuple[float, int, int, tuple]  # time, kind, game, fields
+
+
+def read(path: str) -> Iterator[Record]:
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version = FILE_HEADER.unpack_from(data)
+    assert magic == MAGIC, f"{path} is not a game event log"
+    assert version == VERSION, f"Unsupported event log version {version}"
+
+    offset = FILE_HEADER.size
+    end = len(data)
+    while offset < end:
+        kind, game, at = PREFIX.unpack_from(data, offset)
+        offset += PREFIX.size
+        if kind == BET or kind == CHECK:
+            fields = TWO_BYTES.unpack_from(data, offset)
+            offset += TWO_BYTES.size
+        elif kind == DEAL:
+            key, counter, seats = DEAL_FIELDS.unpack_from(data, offset)
+            offset += DEAL_FIELDS.size
+            fields = (key, counter, struct.unpack_from(f'<{seats}I', data, offset))
+            offset += seats * HAND.size
+        elif kind == START:
+            strings = []
+            count = data[offset]
+            offset += 1
+            for _ in range(count):
+                length = data[offset]
+                strings.append(data[offset + 1:offset + 1 + length].decode())
+                offset += 1 + length
+            fields = tuple(strings)
+        else:
+            fields = (data[offset],)
+            offset += 1
+        yield at, kind, game, fields
+
+
+class Recorded:
+    # Stands in for an Engine's rng, dealing the logged hands
+    __slots__ = ("cards",)
+
+    def __init__(self):
+        self.cards: List[int] = []
+
+    def sample(self, population, k: int) -> List[int]:
+        return self.cards
+
+
+class Replay:
+    # Feeds logged moves back through Engine and checks every outcome the
+    # log recorded against what the rules produce. With solver, each bet
+    # and check also gets the Solver's probability, from the deciding
+    # player's hand, that the bet in question is on the table.
+
+    def __init__(self, solver: bool = False):
+        self.solver = solver
+        self.engines: Dict[int, Engine] = {}
+        self.rooms: Dict[int, str] = {}
+        self.deals: Dict[int, Recorded] = {}
+        self.records = 0
+        self.games = 0
+        self.mismatches: List[Tuple[str, str]] = []  # (room, what)
+        self.decisions: List[tuple] = []  # (room, seat, action, bet, probability, held)
+        if solver:
+            from Solver import hand_probabilities
+            self.hand_probabilities = hand_probabilities
+
+    def mismatch(self, game: int, what: str):
+        self.mismatches.append((self.rooms.get(game, hex(game)), what))
+
+    def decision(self, game: int, engine: Engine, action: str, bet: int):
+        hand = engine.hands[engine.turn]
+        probability = float(self.hand_probabilities(hand, engine.cards_in_play())[bet])
+        seat = engine.sids.index(engine.players[engine.turn])
+        self.decisions.append((self.rooms[game], seat, action, COMBINATIONS[bet].name, probability, engine.bet_holds(bet)))
+
+    def apply(self, kind: int, game: int, fields: tuple):
+        self.records += 1
+        if kind == START:
+            room, *sids = fields
+            deal = self.deals[game] = Recorded()
+            self.engines[game] = Engine(sids, deal)
+            self.rooms[game] = room
+            return
+
+        engine = self.engines.get(game)
+        if engine is None:
+            self.mismatch(game, f"{KIND_NAMES[kind]} before start")
+            return
+
+        if kind == BET:
+            seat, bet = fields
+            if self.solver and engine.players[engine.turn] == engine.sids[seat]:
+                self.decision(game, engine, "bet", bet)
+            if engine.bet(engine.sids[seat], bet)[0].kind != "bet":
+                self.mismatch(game, "illegal bet")
+        elif kind == CHECK:
+            seat, loser = fields
+            if self.solver and engine.last_bet is not None and engine.players[engine.turn] == engine.sids[seat]:
+                self.decision(game, engine, "check", engine.last_bet)
+            events = engine.check(engine.sids[seat])
+            if events[0].kind != "check" or events[1].sid != engine.sids[loser]:
+                self.mismatch(game, "check outcome")
+        elif kind == DEAL:
+            _, _, hands = fields
+            cards = self.deals[game].cards = []
+            for hand in hands:
+                while hand:
+                    low = hand & -hand
+                    cards.append(low)
+                    hand ^= low
+            engine.deal()
+            if tuple(engine.hands) != hands:
+                self.mismatch(game, "deal")
+        elif kind == OUT:
+            if engine.sids[fields[0]] in engine.players:
+                self.mismatch(game, "knock out")
+        elif kind == LEFT:
+            engine.forfeit(engine.sids[fields[0]])
+            if engine.finished and not engine.players:
+                del self.engines[game], self.deals[game]  # everyone left, no winner
+        elif kind == WON:
+            if not engine.finished or engine.players[0] != engine.sids[fields[0]]:
+                self.mismatch(game, "winner")
+            del self.engines[game], self.deals[game]
+            self.games += 1
+
+    def run(self, paths: List[str]):
+        # Several workers' logs are merged by time
+        records = read(paths[0]) if len(paths) == 1 else heapq.merge(*(read(path) for path in paths), key = lambda record: record[0])
+        apply = self.apply
+        for _, kind, game, fields in records:
+            apply(kind, game, fields)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay game event logs through the game rules.")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--solver", default=None, metavar="CSV", help="write the Solver probability of every bet and check to this file")
+    args = parser.parse_args()
+
+    replay = Replay(solver = args.solver is not None)
+    start = time.perf_counter()
+    replay.run(args.paths)
+    seconds = time.perf_counter() - start
+
+    print(f"{replay.records} events, {replay.games} finished games in {seconds:.2f}s ({replay.records / seconds:,.0f} events/s)")
+    print(f"{len(replay.engines)} games unfinished, {len(replay.mismatches)} mismatches")
+    for room, what in replay.mismatches[:20]:
+        print(f"  {room}: {what}")
+
+    if args.solver is not None:
+        with open(args.solver, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["room", "seat", "action", "bet", "probability", "held"])
+            writer.writerows(replay.decisions)
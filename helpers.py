@@ -1,4 +1,5 @@
 import itertools
+from math import comb
 
 RANKS = ["9", "T", "J", "Q", "K", "A"]
 SUITS = ["♠", "♣", "♦", "♥"]
@@ -16,3 +17,7 @@ def is_rank_higher(rank_a, rank_b):
 RANK_PAIRS = [(a,b) for (a,b) in list(itertools.product(RANKS, RANKS)) if a != b]
 RANK_PAIRS_DESCENDING = [(a,b) for (a,b) in RANK_PAIRS if is_rank_higher(a, b)]
 
+BINOMIALS = [[comb(n, k) for k in range(TOTAL_CARDS_NUM + 1)] for n in range(TOTAL_CARDS_NUM + 1)]
+
+def binomial(n, k):
+    return BINOMIALS[n][k]
@@ -0,0 +1,225 @@
+import argparse
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+import socketio
+
+from Advisor import get_advisor
+from Card import Card
+from Hand import Hand
+from Matchmaker import percentile
+from registry import BY_NAME, COMBINATIONS
+
+INVALID = {"not_your_turn", "first_turn_check", "invalid_bet", "bet_too_low"}
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connect_seconds: List[float] = []
+        self.match_seconds: List[float] = []
+        self.bet_seconds: List[float] = []
+        self.connected_at: List[float] = []
+        self.games = 0
+        self.errors = 0
+
+    def add(self, name: str, value: float):
+        with self.lock:
+            getattr(self, name).append(value)
+
+    def count(self, name: str):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+class LoadClient:
+    # One simulated player. It follows the game from the structured fields
+    # of game_update ('kind', 'turn', 'bet') and bets when it is its turn,
+    # until it has finished `games` games.
+
+    def __init__(self, url: str, stats: Stats, games: int, strategy: str, rng: random.Random):
+        self.url = url
+        self.stats = stats
+        self.games_left = games
+        self.strategy = strategy
+        self.rng = rng
+        self.done = threading.Event()
+
+        self.sid: Optional[str] = None
+        self.queued_at: Optional[float] = None
+        self.sent_at: Optional[float] = None
+        self.in_game = False
+        self.room: Optional[str] = None
+        self.hand = 0
+        self.cards_in_play = 0
+        self.last_bet: Optional[str] = None
+        self.turn: Optional[str] = None
+
+        self.client = socketio.Client(reconnection = False)
+        self.client.on("batch", self.on_batch)
+        self.client.on("disconnect", lambda *reason: self.done.set())
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            self.client.connect(self.url, transports = ["websocket"])
+        except socketio.exceptions.ConnectionError:
+            self.stats.count("errors")
+            self.done.set()
+            return
+        self.stats.add("connect_seconds", time.perf_counter() - start)
+        self.stats.add("connected_at", time.perf_counter())
+        self.play()
+
+    def play(self):
+        self.queued_at = time.perf_counter()
+        self.client.emit("play")
+
+    def on_batch(self, events: List[dict]):
+        now = time.perf_counter()
+        for event in events:
+            self.handle(event["event"], event["data"], now)
+        if self.in_game and self.turn == self.sid and self.sent_at is None:
+            self.move()
+
+    def handle(self, event: str, data: dict, now: float):
+        if event == "connected":
+            self.sid = data["sid"]
+        elif event == "game_start":
+            self.stats.add("match_seconds", now - self.queued_at)
+            self.in_game = True
+            self.room = data["room"]
+        elif event != "game_update" or data.get("room") != self.room:
+            return  # including updates from a table this client has left
+
+        kind = data.get("kind")
+        if kind == "deal":
+            self.hand = Hand.from_cards(Card(**card) for card in data["your_hand"]).mask
+            self.cards_in_play = sum(data["player_hand_counts"].values())
+            self.last_bet = None
+            self.turn = data["turn"]
+        elif kind == "bet":
+            self.last_bet = data["bet"]
+            self.turn = data["turn"]
+        elif kind in ("check", "left"):
+            self.turn = None  # until the next deal says who starts
+        if kind in ("bet", "check") and data["sid"] == self.sid and self.sent_at is not None:
+            self.stats.add("bet_seconds", now - self.sent_at)
+            self.sent_at = None
+        elif kind in INVALID:
+            self.stats.count("errors")
+            self.sent_at = None
+        elif kind == "won" or (kind == "out" and data["sid"] == self.sid):
+            self.finish_game()
+
+    def finish_game(self):
+        if not self.in_game:
+            return
+        self.in_game = False
+        self.room = None
+        self.turn = None
+        self.stats.count("games")
+        self.games_left -= 1
+        if self.games_left > 0:
+            self.play()
+        else:
+            self.client.disconnect()
+
+    def move(self):
+        self.sent_at = time.perf_counter()
+        self.client.emit("bet", {"bet": self.choose()})
+
+    def choose(self) -> str:
+        last = None if self.last_bet is None else BY_NAME[self.last_bet].id
+        if self.strategy == "solver":
+            advisor = get_advisor(self.hand, self.cards_in_play)
+            if last is not None and advisor.check_wins(last) > 0.5:
+                return "check"
+            best = advisor.best_bet(last)
+            return "check" if best is None else COMBINATIONS[best].name
+        if last is not None and (last + 1 == len(COMBINATIONS) or self.rng.random() < 0.5):
+            return "check"
+        low = 0 if last is None else last + 1
+        return COMBINATIONS[self.rng.randint(low, min(low + 2, len(COMBINATIONS) - 1))].name
+
+
+def run_stage(url: str, clients: int, games: int, strategy: str, rate: float, timeout: float, seed: int = None) -> Dict[str, float]:
+    # Starts clients at `rate` per second, waits for every game to end and
+    # summarizes the stage.
+    rng = random.Random(seed)
+    stats = Stats()
+    players = [LoadClient(url, stats, games, strategy, random.Random(rng.random())) for _ in range(clients)]
+
+    start = time.perf_counter()
+    for player in players:
+        threading.Thread(target = player.run, daemon = True).start()
+        time.sleep(1 / rate)
+    deadline = start + timeout
+    for player in players:
+        player.done.wait(max(0, deadline - time.perf_counter()))
+    seconds = time.perf_counter() - start
+
+    for player in players:
+        if not player.done.is_set():
+            stats.count("errors")
+            player.client.disconnect()
+
+    connected = sorted(stats.connected_at)
+    match = sorted(stats.match_seconds)
+    bets = sorted(stats.bet_seconds)
+    return {
+        "clients": clients,
+        "seconds": seconds,
+        "connections_per_second": len(connected) / max(connected[-1] - start, 1e-9) if connected else 0.0,
+        "games": stats.games,
+        "errors": stats.errors,
+        "bets": len(bets),
+        "bets_per_second": len(bets) / seconds,
+        "match_p50_ms": 1000 * percentile(match, 0.50),
+        "match_p95_ms": 1000 * percentile(match, 0.95),
+        "match_p99_ms": 1000 * percentile(match, 0.99),
+        "bet_p50_ms": 1000 * percentile(bets, 0.50),
+        "bet_p95_ms": 1000 * percentile(bets, 0.95),
+        "bet_p99_ms": 1000 * percentile(bets, 0.99),
+    }
+
+
+def report(result: Dict[str, float]):
+    print(
+        f"{result['clients']:6} clients  {result['connections_per_second']:7.1f} conn/s  {result['games']:6} games"
+        f"  {result['bets_per_second']:8.1f} bets/s  errors {result['errors']}"
+        f"  match p50/p95/p99 {result['match_p50_ms']:.0f}/{result['match_p95_ms']:.0f}/{result['match_p99_ms']:.0f} ms"
+        f"  bet p50/p95/p99 {result['bet_p50_ms']:.1f}/{result['bet_p95_ms']:.1f}/{result['bet_p99_ms']:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play many simulated clients against a running server.")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--clients", type=int, default=100, help="clients in the first (or only) stage")
+    parser.add_argument("--games", type=int, default=3, help="games each client plays")
+    parser.add_argument("--strategy", choices=["random", "solver"], default="random")
+    parser.add_argument("--rate", type=float, default=200, help="new connections per second")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds a stage may take")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--slo-ms", type=float, default=None, help="ramp up until p99 bet round trip exceeds this")
+    parser.add_argument("--step", type=int, default=100, help="clients added per stage when ramping")
+    parser.add_argument("--max-clients", type=int, default=2000)
+    args = parser.parse_args()
+
+    if args.slo_ms is None:
+        report(run_stage(args.url, args.clients, args.games, args.strategy, args.rate, args.timeout, args.seed))
+    else:
+        passing = None
+        for clients in range(args.clients, args.max_clients + 1, args.step):
+            result = run_stage(args.url, clients, args.games, args.strategy, args.rate, args.timeout, args.seed)
+            report(result)
+            if result["bet_p99_ms"] > args.slo_ms or result["errors"]:
+                break
+            passing = clients
+        if passing is None:
+            print(f"p99 bet latency is over {args.slo_ms} ms from the first stage")
+        else:
+            print(f"p99 bet latency stays under {args.slo_ms} ms up to {passing} concurrent clients")
@@ -0,0 +1,34 @@
+import itertools
+import json
+import logging
+import os
+
+
+class SampledLogger:
+    # Logs one JSON object per record, keeping 1 in every 1 / sample_rate
+    # records; a sample_rate of 0 or less keeps none. A disabled level costs
+    # a single isEnabledFor check.
+
+    def __init__(self, name: str, sample_rate: float = None):
+        self.logger = logging.getLogger(name)
+        if sample_rate is None:
+            sample_rate = float(os.environ.get("LOG_SAMPLE_RATE", 1))
+        self.every = max(1, round(1 / sample_rate)) if sample_rate > 0 else 0
+        self.counter = itertools.count()
+
+    def log(self, level: int, msg: str, **fields):
+        if not self.every or not self.logger.isEnabledFor(level):
+            return
+        if self.every > 1 and next(self.counter) % self.every:
+            return
+        self.logger.log(level, json.dumps({'msg': msg, **fields}, default=str, ensure_ascii=False))
+
+    def debug(self, msg: str, **fields):
+        self.log(logging.DEBUG, msg, **fields)
+
+    def info(self, msg: str, **fields):
+        self.log(logging.INFO, msg, **fields)
+
+    def exception(self, msg: str, **fields):
+        # Errors are never sampled out; call from an except block
+        self.logger.exception(json.dumps({'msg': msg, **fields}, default=str, ensure_ascii=False))
@@ -0,0 +1,28 @@
+import threading
+from typing import Callable, Dict, List
+
+
+class Outbox:
+    # Buffers the events produced while one handler runs (per thread) and
+    # flushes them as a single "batch" message per recipient, in the order
+    # recipients first appeared.
+
+    def __init__(self):
+        self.local = threading.local()
+
+    @property
+    def events(self) -> Dict[str, List[dict]]:
+        if not hasattr(self.local, "events"):
+            self.local.events = {}
+        return self.local.events
+
+    def add(self, event: str, data: dict, to: str):
+        self.events.setdefault(to, []).append({'event': event, 'data': data})
+
+    def flush(self, send: Callable[[str, list, str], None]):
+        events, self.local.events = self.events, {}
+        for to, batch in events.items():
+            send('batch', batch, to)
+
+
+outbox = Outbox()
@@ -0,0 +1,111 @@
+import argparse
+import itertools
+import random
+from typing import List, Optional
+
+import numpy as np
+from tqdm import tqdm
+
+from Hand import Hand, CARDS, canonicalize
+from Solver import Solver
+import metrics
+from registry import COMBINATIONS, suit_permutation_index
+from helpers import TOTAL_CARDS_NUM
+
+TABLE_FILENAME = 'probability_table.npy'
+HANDS_FILENAME = 'probability_table_hands.npy'
+
+MAX_HAND_CARDS = 5
+
+# table[hand_id, cards_in_play_num, combination_index], NaN where cards_in_play_num < len(hand)
+
+
+def canonical_hands(max_hand_cards: int = MAX_HAND_CARDS) -> List[int]:
+    masks = set()
+    for k in range(max_hand_cards + 1):
+        for indices in itertools.combinations(range(TOTAL_CARDS_NUM), k):
+            masks.add(canonicalize(sum(1 << i for i in indices))[0])
+    return sorted(masks)
+
+
+def build(table_filename: str = TABLE_FILENAME, hands_filename: str = HANDS_FILENAME):
+
+    hands = canonical_hands()
+
+    table = np.lib.format.open_memmap(
+        table_filename, mode='w+', dtype=np.float64,
+        shape=(len(hands), TOTAL_CARDS_NUM + 1, len(COMBINATIONS))
+    )
+    table[:] = np.nan
+
+    for hand_id, mask in enumerate(tqdm(hands, desc="hands")):
+        hand = Hand(mask).cards()
+        for n in range(len(hand), TOTAL_CARDS_NUM + 1):
+            table[hand_id, n] = Solver(hand, n).compute_probabilities()
+
+    table.flush()
+    np.save(hands_filename, np.array(hands, dtype=np.int64))
+
+
+class ProbabilityTable:
+    def __init__(self, table_filename: str = TABLE_FILENAME, hands_filename: str = HANDS_FILENAME):
+        self.table = np.load(table_filename, mmap_mode='r')
+        self.hand_ids = {int(mask): hand_id for hand_id, mask in enumerate(np.load(hands_filename))}
+
+    def covers(self, hand: Hand) -> bool:
+        return len(hand) <= MAX_HAND_CARDS
+
+    def lookup(self, hand: Hand, cards_in_play_num: int) -> np.ndarray:
+        assert cards_in_play_num >= len(hand)
+        assert cards_in_play_num <= TOTAL_CARDS_NUM
+        mask, perm = canonicalize(hand.mask)
+        return self.table[self.hand_ids[mask], cards_in_play_num][suit_permutation_index(perm)]
+
+
+_table = None
+
+
+def get_table() -> Optional[ProbabilityTable]:
+    global _table
+    if _table is None:
+        try:
+            _table = ProbabilityTable()
+        except FileNotFoundError:
+            return None
+    return _table
+
+
+def verify(samples: int = 1000, seed: int = 0) -> int:
+
+    table = ProbabilityTable()
+    rng = random.Random(seed)
+
+    mismatches = 0
+    for _ in tqdm(range(samples), desc="verify"):
+        hand = rng.sample(CARDS, rng.randint(0, MAX_HAND_CARDS))
+        n = rng.randint(len(hand), TOTAL_CARDS_NUM)
+        expected = Solver(hand, n).compute_probabilities()
+        actual = table.lookup(Hand.from_cards(hand), n)
+        if not np.array_equal(actual, expected):
+            mismatches += 1
+            print(f"Mismatch for {hand=} {n=}")
+
+    print(f"{mismatches} mismatches in {samples} samples")
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or verify the precomputed probability table.")
+    parser.add_argument("command", choices=["build", "verify"])
+    parser.add_argument("--samples", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve Prometheus metrics, including Solver timings, on this port")
+    args = parser.parse_args()
+
+    if args.metrics_port is not None:
+        metrics.serve(args.metrics_port)
+
+    if args.command == "build":
+        build()
+    else:
+        exit(1 if verify(args.samples, args.seed) else 0)
@@ -0,0 +1,130 @@
+from typing import Dict, List, NamedTuple, Tuple
+from functools import lru_cache
+
+from helpers import (
+    RANKS,
+    SUITS,
+    RANK_PAIRS,
+    RANK_PAIRS_DESCENDING,
+    SMALL_STRAIGHT_RANKS,
+    BIG_STRAIGHT_RANKS,
+    TOTAL_CARDS_NUM,
+)
+from Hand import FEATURE_MASKS
+
+# Feature indices, matching Hand.FEATURE_MASKS:
+# rank counts, suit counts, small poker counts, big poker counts
+RANK_FEATURE = {rank: i for i, rank in enumerate(RANKS)}
+SUIT_FEATURE = {suit: len(RANKS) + i for i, suit in enumerate(SUITS)}
+SMALL_POKER_FEATURE = {suit: len(RANKS) + len(SUITS) + i for i, suit in enumerate(SUITS)}
+BIG_POKER_FEATURE = {suit: len(RANKS) + 2 * len(SUITS) + i for i, suit in enumerate(SUITS)}
+FEATURES_NUM = len(RANKS) + 3 * len(SUITS)
+
+
+
+# numpy is only imported by the vectorized helpers below, so the game
+# server can use the registry without it.
+
+@lru_cache(maxsize=None)
+def feature_matrix() -> "np.ndarray":
+    # feature_matrix()[card_index, feature] = 1 if the card counts towards the feature
+    import numpy as np
+    matrix = np.array(
+        [[mask >> i & 1 for mask in FEATURE_MASKS] for i in range(TOTAL_CARDS_NUM)],
+        dtype=np.float32
+    )
+    matrix.setflags(write=False)
+    return matrix
+
+
+class Combination(NamedTuple):
+    id: int  # stable; also the bet order, higher id beats lower id
+    name: str
+    family: str
+    kwargs: Dict[str, str]
+    conditions: Tuple[Tuple[int, int], ...]  # (feature, minimum count), all must hold
+
+    @property
+    def check(self) -> str:
+        # Deck method deciding membership
+        return f"is_{self.family}"
+
+    @property
+    def probability(self) -> str:
+        # Solver method counting the probability
+        return f"probability_{self.family}"
+
+    def holds(self, features: List[int]) -> bool:
+        return all(features[feature] >= count for feature, count in self.conditions)
+
+
+COMBINATIONS: List[Combination] = []
+
+
+def register(name: str, family: str, kwargs: Dict[str, str], conditions: List[Tuple[int, int]]):
+    COMBINATIONS.append(Combination(len(COMBINATIONS), name, family, kwargs, tuple(conditions)))
+
+
+for rank in RANKS:
+    register(f"high_card_{rank}", "high_card", {"rank": rank}, [(RANK_FEATURE[rank], 1)])
+for rank in RANKS:
+    register(f"pair_{rank}", "pair", {"rank": rank}, [(RANK_FEATURE[rank], 2)])
+for a, b in RANK_PAIRS_DESCENDING:
+    register(f"two_pair_{a}_{b}", "two_pair", {"rank_a": a, "rank_b": b}, [(RANK_FEATURE[a], 2), (RANK_FEATURE[b], 2)])
+register("small_straight", "small_straight", {}, [(RANK_FEATURE[rank], 1) for rank in RANKS if rank in SMALL_STRAIGHT_RANKS])
+register("big_straight", "big_straight", {}, [(RANK_FEATURE[rank], 1) for rank in RANKS if rank in BIG_STRAIGHT_RANKS])
+for rank in RANKS:
+    register(f"three_{rank}", "three", {"rank": rank}, [(RANK_FEATURE[rank], 3)])
+for a, b in RANK_PAIRS:
+    register(f"full_{a}_{b}", "full", {"rank_a": a, "rank_b": b}, [(RANK_FEATURE[a], 3), (RANK_FEATURE[b], 2)])
+for rank in RANKS:
+    register(f"quad_{rank}", "quad", {"rank": rank}, [(RANK_FEATURE[rank], 4)])
+for suit in SUITS:
+    register(f"flush_{suit}", "flush", {"suit": suit}, [(SUIT_FEATURE[suit], 5)])
+for suit in SUITS:
+    register(f"small_poker_{suit}", "small_poker", {"suit": suit}, [(SMALL_POKER_FEATURE[suit], 5)])
+for suit in SUITS:
+    register(f"big_poker_{suit}", "big_poker", {"suit": suit}, [(BIG_POKER_FEATURE[suit], 5)])
+
+BY_NAME: Dict[str, Combination] = {combination.name: combination for combination in COMBINATIONS}
+NAMES: List[str] = [combination.name for combination in COMBINATIONS]
+
+
+def bet_id(name: str) -> int:
+    return BY_NAME[name].id
+
+
+def evaluate(features: "np.ndarray") -> "np.ndarray":
+    # (rows, FEATURES_NUM) counts -> (rows, len(COMBINATIONS)) bool; a single
+    # (FEATURES_NUM,) hand gives a (len(COMBINATIONS),) vector
+    import numpy as np
+    single = np.ndim(features) == 1
+    features = np.atleast_2d(features)
+
+    at_least = {count: features >= count for count in range(1, 6)}
+    result = np.empty((len(features), len(COMBINATIONS)), dtype=bool)
+    for combination in COMBINATIONS:
+        (feature, count), *rest = combination.conditions
+        column = at_least[count][:, feature]
+        for feature, count in rest:
+            column = column & at_least[count][:, feature]
+        result[:, combination.id] = column
+
+    return result[0] if single else result
+
+
+@lru_cache(maxsize=None)
+def suit_permutation_index(perm: Tuple[int, ...]) -> List[int]:
+    # For a hand relabelled with perm (old suit index -> new suit index),
+    # entry i of a per-combination vector of the original hand is entry
+    # suit_permutation_index(perm)[i] of the relabelled one.
+    result = []
+    for combination in COMBINATIONS:
+        if "suit" in combination.kwargs:
+            suit = SUITS[perm[SUITS.index(combination.kwargs["suit"])]]
+            combination = next(
+                other for other in COMBINATIONS
+                if other.family == combination.family and other.kwargs["suit"] == suit
+            )
+        result.append(combination.id)
+    return result
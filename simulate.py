@@ -7,19 +7,26 @@ import random
 from typing import List
 from functools import partial
 import pickle
-import re
 import multiprocessing
-
+import argparse
+import collections
+import os
+import signal
 from Card import Card
 from Deck import Deck
+from helpers import TOTAL_CARDS_NUM
+import counts_store
+from counts_store import wilson_interval
+import registry
+
+FEATURE_MATRIX = registry.feature_matrix()
 
 filename = 'simulation_counts.pickle'
 
-deck = Deck()
+combination_names = registry.NAMES
+cards_in_play_n_list = list(range(2,19))
 
 def init_counts():
-    combination_names = [combination_name for combination_name, _ in deck.combinations]
-    cards_in_play_n_list = list(range(2,19))
     counts = pd.DataFrame(0, index=cards_in_play_n_list, columns=combination_names)
     counts.attrs = {"n": 0}
     return counts
@@ -39,76 +46,236 @@ def get_counts():
     except FileNotFoundError:
         return init_counts()
 
-def get_counts_probabilities():
-    df = load_counts()
-    return df / df.attrs["n"]
-
-def get_counts_probabilities_average():
-
-    counts = get_counts()
-    combs = [
-        'is_high_card',
-        'is_pair',
-        'is_two_pair',
-        'is_small_straight',
-        'is_big_straight',
-        'is_three',
-        'is_full',
-        'is_quad',
-        'is_flush',
-        'is_small_poker',
-        'is_big_poker'
-    ]
-
-    df = pd.DataFrame()
-
-    for comb in combs:
-        matching_cols = [col for col in counts.columns if re.search(comb, col)]
-        df[comb] = counts[matching_cols].mean(axis=1) / counts.attrs["n"]
+def open_counts(path: str = None) -> counts_store.Counts:
+    # The simulation checkpoint (memory-mapped), or the legacy pickle while
+    # there is no checkpoint yet
+    if path is None:
+        path = checkpoint_filename if os.path.exists(checkpoint_filename) else filename
+    if path.endswith('.pickle'):
+        return counts_store.from_pickle(path)
+    return counts_store.open_counts(path)
+
+def get_counts_probabilities(path: str = None) -> pd.DataFrame:
+    counts = open_counts(path)
+    return pd.DataFrame(counts.query().probability, index=counts.cards_in_play, columns=counts.names)
+
+def get_counts_probabilities_average(path: str = None) -> pd.DataFrame:
+    # Mean probability over each combination family, in columns named
+    # is_<family> like the legacy pickle's
+    counts = open_counts(path)
+    probability = counts.query().probability
+    df = pd.DataFrame(index=counts.cards_in_play)
+    for family in dict.fromkeys(combination.family for combination in registry.COMBINATIONS):
+        columns = [counts.column[combination.name] for combination in registry.COMBINATIONS if combination.family == family]
+        df[f"is_{family}"] = probability[:, columns].mean(axis=1)
     return df
 
 
 
-def compute_counts(id):
+# VECTORIZED SAMPLING
+
+CARD_BITS = (TOTAL_CARDS_NUM - 1).bit_length()
+
+def sample_features(rng: np.random.Generator, cards_in_play_n_list: List[int], size: int) -> np.ndarray:
+    # (len(cards_in_play_n_list) * size, features); rows grouped by n
+    n_per_row = np.repeat(np.array(cards_in_play_n_list), size)
+    # Random high bits above the card's column, so keys of a row never tie
+    # and exactly n of them are <= the nth smallest
+    keys = rng.integers(0, 1 << (32 - CARD_BITS), size=(len(n_per_row), TOTAL_CARDS_NUM), dtype=np.uint32) << np.uint32(CARD_BITS)
+    keys |= np.arange(TOTAL_CARDS_NUM, dtype=np.uint32)
+    thresholds = np.sort(keys, axis=1)[np.arange(len(n_per_row)), n_per_row - 1]
+    in_play = keys <= thresholds[:, None]
+    return (in_play.astype(np.float32) @ FEATURE_MATRIX).astype(np.int8)
+
+def sample_counts(rng: np.random.Generator, cards_in_play_n_list: List[int], size: int) -> np.ndarray:
+    # (len(cards_in_play_n_list), combinations) int64 hit counts over size hands per n
+    hits = registry.evaluate(sample_features(rng, cards_in_play_n_list, size))
+    return hits.reshape(len(cards_in_play_n_list), size, -1).sum(axis=1, dtype=np.int64)
+
+def compute_counts(id, n = 600_000, batch_size = 20_000, seed = None):
     from os import getpid
     # print(id, getpid())
 
-    deck = Deck()
+    rng = np.random.default_rng(None if seed is None else [seed, id])
+    # The last batch is smaller when batch_size does not divide n
+    sizes = [batch_size] * (n // batch_size) + ([n % batch_size] if n % batch_size else [])
+
+    new_counts = np.zeros((len(cards_in_play_n_list), len(combination_names)), dtype=np.int64)
+    for size in tqdm(sizes, desc=f"{getpid()}"):
+        new_counts += sample_counts(rng, cards_in_play_n_list, size)
+
     counts = init_counts()
+    counts.iloc[:, :] = new_counts
+    counts.attrs["n"] += n
+
+    return counts
 
-    n = 600
+# STREAMING RUNNER
 
-    for _ in tqdm(range(n), desc=f"{getpid()}"):
-        
-        for cards_in_play_n in counts.index:
-            
-            cards_in_play = deck.sample(cards_in_play_n)
-            
-            for combination_name, func in cards_in_play.combinations[:]:
-                counts.loc[cards_in_play_n, combination_name] += int(func())
+# In the counts_store format, with its schema in simulation_counts.bin.json
+checkpoint_filename = 'simulation_counts.bin'
 
-            del cards_in_play
+class Accumulator:
+    def __init__(self, seed: int, batches: int = 0, samples: np.ndarray = None, counts: np.ndarray = None):
+        self.seed = seed
+        self.batches = batches
+        self.samples = np.zeros(len(cards_in_play_n_list), dtype=np.int64) if samples is None else samples
+        self.counts = np.zeros((len(cards_in_play_n_list), len(combination_names)), dtype=np.int64) if counts is None else counts
 
-    counts.attrs["n"] += n
+    def add(self, rows: List[int], size: int, counts: np.ndarray):
+        self.samples[rows] += size
+        self.counts[rows] += counts
 
-    return counts
+    def ci_width(self) -> np.ndarray:
+        low, high = wilson_interval(self.counts, self.samples[:, None])
+        return np.where(self.samples[:, None] > 0, high - low, np.inf)
+
+    def needed_samples(self, ci_width: float) -> np.ndarray:
+        # Per row estimate of the samples still needed, from the interval
+        # width shrinking as 1 / sqrt(samples).
+        widths = self.ci_width().max(axis=1)
+        sampled = self.samples > 0
+        needed = np.full(len(self.samples), np.inf)
+        needed[sampled] = np.ceil(self.samples[sampled] * (widths[sampled] / ci_width) ** 2) - self.samples[sampled]
+        return np.where(widths > ci_width, np.maximum(needed, 1), 0)
 
-def run():
+    def uniform_savings(self) -> int:
+        # Samples a uniform schedule would have needed to give every row as
+        # many samples as the most sampled one, minus what was spent.
+        return int(self.samples.max() * len(self.samples) - self.samples.sum())
 
-    workers = multiprocessing.cpu_count() // 2
+    def save(self, filename: str = checkpoint_filename):
+        counts_store.write(filename, self.seed, self.batches, cards_in_play_n_list, combination_names, self.samples, self.counts)
 
-    while True:
+    @staticmethod
+    def load(filename: str = checkpoint_filename) -> "Accumulator":
+        counts = counts_store.open_counts(filename)
+        assert counts.cards_in_play == cards_in_play_n_list, "Checkpoint rows do not match cards_in_play_n_list"
+        assert counts.names == combination_names, "Checkpoint columns do not match combinations"
+        return Accumulator(counts.seed, counts.batches, np.array(counts.samples), np.array(counts.counts))
 
-        counts = get_counts()
+def sample_batch(task):
+    seed, batch, rows, size = task
+    rng = np.random.default_rng([seed, batch])
+    return rows, size, sample_counts(rng, [cards_in_play_n_list[row] for row in rows], size)
 
-        pool = multiprocessing.Pool(processes = workers)
-        new_counts_list = pool.map(compute_counts, range(workers))
+def ignore_sigint():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
 
-        for new_counts in new_counts_list:
-            counts += new_counts
-            counts.attrs["n"] += new_counts.attrs["n"]
-            
-        save_counts(counts)
+def run(
+    target_samples: int = None,
+    time_budget: float = None,
+    ci_width: float = None,
+    workers: int = None,
+    batch_size: int = 20_000,
+    min_batch_size: int = 1_000,
+    checkpoint_every: float = 30,
+    seed: int = None,
+    filename: str = checkpoint_filename,
+    adaptive: bool = False,
+):
+    # Runs until every cell has target_samples samples, time_budget seconds
+    # pass, every Wilson interval is narrower than ci_width, or Ctrl-C.
+    # Completed batches are always merged and checkpointed before exiting.
+    # With adaptive, each batch samples the one cards-in-play size that still
+    # needs the most samples for all of its cells to be narrower than ci_width.
+
+    assert not adaptive or ci_width is not None, "Adaptive sampling needs a ci_width"
+
+    if workers is None:
+        workers = max(1, multiprocessing.cpu_count() // 2)
+
+    if os.path.exists(filename):
+        accumulator = Accumulator.load(filename)
+    else:
+        accumulator = Accumulator(random.getrandbits(63) if seed is None else seed)
+
+    all_rows = list(range(len(cards_in_play_n_list)))
+
+    def done():
+        if target_samples is not None and accumulator.samples.min() >= target_samples:
+            return True
+        if time_budget is not None and time.monotonic() - start >= time_budget:
+            return True
+        if ci_width is not None and accumulator.ci_width().max() <= ci_width:
+            return True
+        return False
+
+    in_flight = np.zeros(len(cards_in_play_n_list), dtype=np.int64)
+
+    def next_task():
+        if not adaptive:
+            return all_rows, batch_size
+        needed = accumulator.needed_samples(ci_width)
+        needed = np.where(np.isinf(needed), batch_size, needed)
+        row = int(np.argmax(needed - in_flight))
+        size = int(np.clip(needed[row] - in_flight[row], min_batch_size, batch_size))
+        return [row], size
+
+    start = last_checkpoint = time.monotonic()
+
+    pool = multiprocessing.Pool(processes = workers, initializer = ignore_sigint)
+    progress = tqdm(unit = "hands", unit_scale = True)
+
+    # Batches are merged in the order they were issued, so the checkpoint's
+    # batch counter is exactly the next batch to run after a resume.
+    pending = collections.deque()
+    next_batch = accumulator.batches
+    try:
+        while not done():
+            while len(pending) < 2 * workers:
+                rows, size = next_task()
+                task = (accumulator.seed, next_batch, rows, size)
+                pending.append(pool.apply_async(sample_batch, (task,)))
+                in_flight[rows] += size
+                next_batch += 1
+
+            rows, size, counts = pending.popleft().get()
+            in_flight[rows] -= size
+            accumulator.add(rows, size, counts)
+            accumulator.batches += 1
+            progress.update(len(rows) * size)
+
+            if time.monotonic() - last_checkpoint >= checkpoint_every:
+                accumulator.save(filename)
+                last_checkpoint = time.monotonic()
+    except KeyboardInterrupt:
+        print("Interrupted, saving completed batches")
+    finally:
+        pool.terminate()
+        pool.join()
+        progress.close()
+        accumulator.save(filename)
+
+    if adaptive:
+        print(f"Samples per cards-in-play size: {dict(zip(cards_in_play_n_list, accumulator.samples.tolist()))}")
+        print(f"Saved {accumulator.uniform_savings()} samples compared with a uniform schedule")
+
+    return accumulator
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="Monte Carlo simulation of combination counts.")
+    parser.add_argument("--samples", type=int, default=None, help="stop once every cell has this many samples")
+    parser.add_argument("--time", type=float, default=None, help="stop after this many seconds")
+    parser.add_argument("--ci-width", type=float, default=None, help="stop once every 95%% Wilson interval is this narrow")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=20_000, help="hands per cards-in-play size per batch")
+    parser.add_argument("--min-batch-size", type=int, default=1_000, help="smallest adaptive batch")
+    parser.add_argument("--checkpoint-every", type=float, default=30, help="seconds between checkpoints")
+    parser.add_argument("--adaptive", action="store_true", help="only sample sizes whose intervals are still wider than --ci-width")
+    parser.add_argument("--seed", type=int, default=None, help="seed for a new checkpoint")
+    parser.add_argument("--output", default=checkpoint_filename)
+    args = parser.parse_args()
+
+    run(
+        target_samples = args.samples,
+        time_budget = args.time,
+        ci_width = args.ci_width,
+        workers = args.workers,
+        batch_size = args.batch_size,
+        min_batch_size = args.min_batch_size,
+        checkpoint_every = args.checkpoint_every,
+        seed = args.seed,
+        filename = args.output,
+        adaptive = args.adaptive,
+    )
@@ -0,0 +1,184 @@
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from Game import Game
+
+
+class MemoryBackend:
+    # Keeps Game objects in this process. Only usable with a single worker.
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.games: Dict[str, Game] = {}
+        self.rooms_by_sid: Dict[str, str] = {}
+        self.updated: Dict[str, float] = {}
+
+    @contextmanager
+    def locked(self, room: str):
+        with self.lock:
+            yield
+
+    def load(self, room: str) -> Optional[Game]:
+        return self.games.get(room)
+
+    def save(self, game: Game):
+        with self.lock:
+            self.games[game.room] = game
+            self.updated[game.room] = time.time()
+            playing = set(game.player_sids)
+            for sid in game.sids:
+                if sid in playing:
+                    self.rooms_by_sid[sid] = game.room
+                elif self.rooms_by_sid.get(sid) == game.room:
+                    del self.rooms_by_sid[sid]  # out of the game, free to play again
+
+    def save_many(self, games: List[Game]):
+        # New rooms only
+        with self.lock:
+            for game in games:
+                assert game.room not in self.games, f"Room {game.room} already exists"
+                self.save(game)
+
+    def delete(self, room: str) -> bool:
+        with self.lock:
+            game = self.games.pop(room, None)
+            self.updated.pop(room, None)
+            if game is None:
+                return False
+            for sid in game.sids:
+                if self.rooms_by_sid.get(sid) == room:
+                    del self.rooms_by_sid[sid]
+            return True
+
+    def room_for(self, sid: str) -> Optional[str]:
+        return self.rooms_by_sid.get(sid)
+
+    def remove_sid(self, sid: str) -> Optional[str]:
+        with self.lock:
+            return self.rooms_by_sid.pop(sid, None)
+
+    def idle_rooms(self, timeout: float) -> List[str]:
+        deadline = time.time() - timeout
+        with self.lock:
+            return [room for room, updated in self.updated.items() if updated < deadline]
+
+    def __len__(self):
+        return len(self.games)
+
+
+class SQLiteBackend:
+    # Stores Game.to_state() blobs in SQLite files shared by every worker on
+    # the host. Rooms are sharded over `shards` files by crc32, so workers
+    # only contend on the lock of the shard they touch. The sid -> room index
+    # lives in its own file and is only written in single autocommit
+    # statements, so no lock is ever held while waiting for another.
+
+    def __init__(self, path: str = "game_state", shards: int = 8, timeout: float = 30):
+        self.paths = [f"{path}.{shard}.sqlite" for shard in range(shards)]
+        self.index_path = f"{path}.index.sqlite"
+        self.timeout = timeout
+        self.local = threading.local()
+        for shard in range(shards):
+            connection = self.connection(shard)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS games (room TEXT PRIMARY KEY, state BLOB, updated REAL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS games_updated ON games (updated)")
+        self.index().execute("PRAGMA journal_mode=WAL")
+        self.index().execute("CREATE TABLE IF NOT EXISTS players (sid TEXT PRIMARY KEY, room TEXT)")
+
+    def shard(self, key: str) -> int:
+        return zlib.crc32(key.encode()) % len(self.paths)
+
+    def connect(self, key, path: str) -> sqlite3.Connection:
+        # One connection per thread and file; autocommit unless locked()
+        if not hasattr(self.local, "connections"):
+            self.local.connections = {}
+        if key not in self.local.connections:
+            self.local.connections[key] = sqlite3.connect(path, timeout=self.timeout, isolation_level=None)
+        return self.local.connections[key]
+
+    def connection(self, shard: int) -> sqlite3.Connection:
+        return self.connect(shard, self.paths[shard])
+
+    def index(self) -> sqlite3.Connection:
+        return self.connect("index", self.index_path)
+
+    @contextmanager
+    def locked(self, room: str):
+        # Write-locks the room's shard across processes until the block ends
+        connection = self.connection(self.shard(room))
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def load(self, room: str) -> Optional[Game]:
+        row = self.connection(self.shard(room)).execute("SELECT state FROM games WHERE room = ?", (room,)).fetchone()
+        return None if row is None else Game.from_state(row[0])
+
+    def save(self, game: Game):
+        self.connection(self.shard(game.room)).execute(
+            "INSERT OR REPLACE INTO games VALUES (?, ?, ?)", (game.room, game.to_state(), time.time())
+        )
+        playing = set(game.player_sids)
+        self.index().executemany("INSERT OR REPLACE INTO players VALUES (?, ?)", [(sid, game.room) for sid in playing])
+        self.index().executemany(
+            "DELETE FROM players WHERE sid = ? AND room = ?", [(sid, game.room) for sid in game.sids if sid not in playing]
+        )
+
+    def save_many(self, games: List[Game]):
+        # New rooms in one transaction per shard; a room that already exists
+        # raises sqlite3.IntegrityError rather than being overwritten
+        by_shard: Dict[int, list] = {}
+        for game in games:
+            by_shard.setdefault(self.shard(game.room), []).append((game.room, game.to_state(), time.time()))
+        for shard, rows in by_shard.items():
+            connection = self.connection(shard)
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.executemany("INSERT INTO games VALUES (?, ?, ?)", rows)
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        self.index().executemany(
+            "INSERT OR REPLACE INTO players VALUES (?, ?)",
+            [(sid, game.room) for game in games for sid in game.player_sids]
+        )
+
+    def delete(self, room: str) -> bool:
+        game = self.load(room)
+        if game is None:
+            return False
+        self.connection(self.shard(room)).execute("DELETE FROM games WHERE room = ?", (room,))
+        self.index().executemany("DELETE FROM players WHERE sid = ? AND room = ?", [(sid, room) for sid in game.sids])
+        return True
+
+    def room_for(self, sid: str) -> Optional[str]:
+        row = self.index().execute("SELECT room FROM players WHERE sid = ?", (sid,)).fetchone()
+        return None if row is None else row[0]
+
+    def remove_sid(self, sid: str) -> Optional[str]:
+        row = self.index().execute("DELETE FROM players WHERE sid = ? RETURNING room", (sid,)).fetchone()
+        return None if row is None else row[0]
+
+    def idle_rooms(self, timeout: float) -> List[str]:
+        deadline = time.time() - timeout
+        return [
+            room
+            for shard in range(len(self.paths))
+            for room, in self.connection(shard).execute("SELECT room FROM games WHERE updated < ?", (deadline,))
+        ]
+
+    def __len__(self):
+        return sum(
+            self.connection(shard).execute("SELECT COUNT(*) FROM games").fetchone()[0]
+            for shard in range(len(self.paths))
+        )
@@ -1,10 +1,10 @@
 import pandas as pd
 import streamlit as st
 from Card import Card
-from Deck import Deck
-from simulate import init_counts
-from Solver import Solver, combinations
-from helpers import RANKS, SUITS, RANK_PAIRS, RANK_PAIRS_DESCENDING
+from Hand import Hand
+from Solver import hand_probabilities
+from registry import NAMES
+from helpers import RANKS, SUITS
 
 # Initialize Session State
 if 'hand' not in st.session_state:
@@ -33,17 +33,20 @@ for i, col in enumerate(st.columns(len(RANKS))):
             on_change=toogle_card, args = [card]
         )
 
-solver = Solver(
-    hand = list(st.session_state.hand),
-    unknown_cards_in_play_num = st.session_state.n - len(st.session_state.hand)
-)
+@st.cache_resource
+def table_template() -> pd.DataFrame:
+    return pd.DataFrame({"Combination": NAMES, "Probability": 0.0})
 
-s = pd.Series()
+# Process-wide, keyed on the frozen hand (its bitmask) and n. Toggling a
+# card only looks up one vector: Solver.hand_probabilities shares it
+# between suit-isomorphic hands and reads the precomputed table when
+# present, so nothing is re-solved on reruns.
+@st.cache_resource(max_entries = 4096)
+def probability_table(mask: int, n: int) -> pd.DataFrame:
+    df = table_template().copy()
+    df["Probability"] = hand_probabilities(mask, n)
+    return df
 
-for name, method, kwargs in combinations:
-    s[name] = getattr(solver, method)(**kwargs)
-    
-df = pd.DataFrame(s, columns=["Combinations"])
-df = df.reset_index()
+hand = Hand.from_cards(st.session_state.hand)
 
-st.table(df)
\ No newline at end of file
+st.table(probability_table(hand.mask, max(st.session_state.n, len(hand))))
\ No newline at end of file